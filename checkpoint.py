@@ -0,0 +1,99 @@
+import os
+import struct
+from typing import Iterable, Optional, Sequence
+
+# Every record is a type byte and the payload length, followed by the payload
+record_header = struct.Struct("<cI")
+depth_record = b"D"   # Payload: depth (uint16), then the item name in utf-8
+cursor_record = b"C"  # Payload: the search cursor as int32s
+depth_struct = struct.Struct("<H")
+
+
+class CheckpointJournal:
+    """
+    Append-only log of the search's progress.
+    Each save only appends the best depths found since the last save, and the latest cursor.
+    Replaying the log gives back the whole state. Old cursors pile up, so the log is compacted once in a while.
+    """
+    location: str
+    temporary_location: str
+    file = None
+    depth_records: int = 0   # Number of best depths in the log
+    stale_records: int = 0   # Cursors that have been superseded since the last compaction
+
+    def __init__(self, location: str = "persistent.journal"):
+        self.location = location
+        self.temporary_location = location + ".tmp"
+
+    def replay(self) -> tuple[Optional[list[int]], dict[str, int]]:
+        """
+        Read the log back, and open it for appending.
+        :return: The latest cursor, if any, and the best depths in the order they were found
+        """
+        cursor = None
+        best_depths = {}
+        self.stale_records = 0
+        with open(self.location, "rb") as file:
+            data = file.read()
+
+        offset = 0
+        while offset + record_header.size <= len(data):
+            record_type, length = record_header.unpack_from(data, offset)
+            start = offset + record_header.size
+            if start + length > len(data):
+                break  # Cut off in the middle of a save
+            if record_type == depth_record:
+                depth, = depth_struct.unpack_from(data, start)
+                name = data[start + depth_struct.size:start + length].decode("utf-8")
+                best_depths.setdefault(name, depth)
+            elif record_type == cursor_record:
+                if cursor is not None:
+                    self.stale_records += 1
+                cursor = list(struct.unpack_from(f"<{length // 4}i", data, start))
+            else:
+                break
+            offset = start + length
+
+        self.depth_records = len(best_depths)
+        self.file = open(self.location, "r+b")
+        # Drop whatever was cut off, so that new records line up
+        self.file.truncate(offset)
+        self.file.seek(offset)
+        return cursor, best_depths
+
+    def append(self, new_best_depths: Iterable[tuple[str, int]], cursor: Sequence[int]):
+        if self.file is None:
+            # Closed, carry on where it left off. A new log is only ever started by compact()
+            self.file = open(self.location, "ab")
+        self.stale_records += 1
+        self.file.write(self.encode(new_best_depths, cursor))
+        self.file.flush()
+
+    def compact(self, best_depths: dict[str, int], cursor: Sequence[int]):
+        """
+        Rewrite the log with only the live records.
+        """
+        self.close()
+        with open(self.temporary_location, "wb") as file:
+            file.write(self.encode(best_depths.items(), cursor))
+        os.replace(self.temporary_location, self.location)
+        self.file = open(self.location, "ab")
+        self.depth_records = len(best_depths)
+        self.stale_records = 0
+
+    def encode(self, best_depths: Iterable[tuple[str, int]], cursor: Sequence[int]) -> bytes:
+        records = []
+        for name, depth in best_depths:
+            name_bytes = name.encode("utf-8")
+            records.append(record_header.pack(depth_record, depth_struct.size + len(name_bytes)))
+            records.append(depth_struct.pack(depth))
+            records.append(name_bytes)
+            self.depth_records += 1
+        records.append(record_header.pack(cursor_record, len(cursor) * 4))
+        records.append(struct.pack(f"<{len(cursor)}i", *cursor))
+        return b"".join(records)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
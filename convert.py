@@ -12,6 +12,7 @@ import bidict
 import optimals
 import recipe
 import util
+from util import ordered_total
 
 
 def remove_first_discoveries(savefile: str, new_savefile: str):
@@ -288,21 +289,6 @@ def limit(n: int) -> int:
     return n * (n + 1) // 2
 
 
-@cache
-def ordered_total(cur_limit, cur_step, max_steps, init_list_size=4):
-    if cur_step == max_steps:
-        return 1
-    if cur_limit >= limit(cur_step + init_list_size):
-        return 0
-    # if cur_step == max_steps - 1 and cur_step != 0:
-    #     return limit(cur_step + init_list_size + 1) - limit(cur_step + init_list_size)
-
-    # print(f"Step {cur_step} with limit {cur_limit} has {s} recipes")
-    return \
-            ordered_total(cur_limit + 1, cur_step + 1, max_steps, init_list_size) + \
-            ordered_total(cur_limit + 1, cur_step, max_steps, init_list_size)
-
-
 def ordered_total_from_current(current_state: list[int]):
     init_list_size = 0
     count = 0
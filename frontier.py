@@ -0,0 +1,120 @@
+import heapq
+import os
+import struct
+import zlib
+from array import array
+from itertools import islice
+from typing import Iterable, Iterator
+
+# Every block is the number of records and the compressed size, followed by the zlib-compressed int32s
+block_header = struct.Struct("<II")
+
+
+def write_blocks(location: str, records: Iterable[tuple[int, ...]], block_size: int) -> int:
+    """
+    Write records to a file in compressed blocks.
+    :return: The number of records written
+    """
+    count = 0
+    records = iter(records)
+    with open(location, "wb") as file:
+        while block := list(islice(records, block_size)):
+            data = array('i', [item for record in block for item in record]).tobytes()
+            data = zlib.compress(data, 1)
+            file.write(block_header.pack(len(block), len(data)))
+            file.write(data)
+            count += len(block)
+    return count
+
+
+def read_blocks(location: str, width: int) -> Iterator[tuple[int, ...]]:
+    with open(location, "rb") as file:
+        while header := file.read(block_header.size):
+            n, size = block_header.unpack(header)
+            items = array('i')
+            items.frombytes(zlib.decompress(file.read(size)))
+            for i in range(n):
+                yield tuple(items[i * width:(i + 1) * width])
+
+
+def distinct(records: Iterable[tuple[int, ...]]) -> Iterator[tuple[int, ...]]:
+    # Records are sorted, so duplicates are next to each other
+    last = None
+    for record in records:
+        if record != last:
+            yield record
+            last = record
+
+
+class Frontier:
+    """
+    One level of a breadth first search, on disk: sorted, distinct records of `width` item IDs each.
+    """
+    location: str
+    width: int
+    size: int
+
+    def __init__(self, location: str, width: int, size: int):
+        self.location = location
+        self.width = width
+        self.size = size
+
+    def __iter__(self) -> Iterator[tuple[int, ...]]:
+        return read_blocks(self.location, self.width)
+
+    def __len__(self):
+        return self.size
+
+    def delete(self):
+        os.remove(self.location)
+
+
+class FrontierWriter:
+    """
+    Collects the records of the next level of a breadth first search, with external memory.
+    Records are buffered until there are `chunk_size` of them, then sorted, deduplicated and written out as a run.
+    finish() merges the runs into a Frontier, dropping duplicates across runs as well.
+    """
+    directory: str
+    width: int
+    chunk_size: int
+    block_size: int
+    buffer: set[tuple[int, ...]]
+    runs: list[str]
+
+    def __init__(self, directory: str, width: int, chunk_size: int = 500000, block_size: int = 65536):
+        self.directory = directory
+        self.width = width
+        self.chunk_size = chunk_size
+        self.block_size = block_size
+        self.buffer = set()
+        self.runs = []
+        os.makedirs(directory, exist_ok=True)
+
+    def add(self, record: tuple[int, ...]):
+        self.buffer.add(record)
+        if len(self.buffer) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        location = os.path.join(self.directory, f"run_{self.width}_{len(self.runs)}.bin")
+        write_blocks(location, sorted(self.buffer), self.block_size)
+        self.runs.append(location)
+        self.buffer = set()
+
+    def finish(self, location: str) -> Frontier:
+        if not self.runs:
+            # Everything fit in memory
+            size = write_blocks(location, sorted(self.buffer), self.block_size)
+            self.buffer = set()
+            return Frontier(location, self.width, size)
+
+        self.flush()
+        merged = heapq.merge(*(read_blocks(run, self.width) for run in self.runs))
+        size = write_blocks(location, distinct(merged), self.block_size)
+        for run in self.runs:
+            os.remove(run)
+        self.runs = []
+        return Frontier(location, self.width, size)
@@ -1,19 +1,31 @@
 import argparse
 import atexit
+import bisect
+import multiprocessing
 import os
 import random
 import sys
 import time
+import traceback
+from array import array
+from collections import deque
+from contextvars import ContextVar
 from functools import cache
-from typing import Optional
+from itertools import islice
+from queue import Empty
+from typing import Callable, Iterable, Optional, Sequence
 from urllib.parse import quote_plus
 
 import json
 import asyncio
 import aiohttp
 
+import checkpoint
+import frontier
 import optimals
+import progress
 import recipe
+import stats
 import util
 from util import int_to_pair, pair_to_int, DEFAULT_STARTING_ITEMS, file_sanitize
 
@@ -55,6 +67,16 @@ for l1 in letters:
         for l3 in letters:
             letters3.append(l1 + l2 + l3)
 
+# Starting sets for batch jobs, by name. Same as the lines below
+starting_presets: dict[str, tuple[str, ...]] = {
+    "default": DEFAULT_STARTING_ITEMS,
+    "elements": tuple(list(DEFAULT_STARTING_ITEMS) + elements + ["Periodic Table",]),
+    "letters": tuple(list(DEFAULT_STARTING_ITEMS) + letters),
+    "letters2": tuple(list(DEFAULT_STARTING_ITEMS) + letters + letters2),
+    "letters3": tuple(list(DEFAULT_STARTING_ITEMS) + letters + letters2 + letters3),
+    "speedrun": tuple(list(DEFAULT_STARTING_ITEMS) + speedrun_current_words),
+}
+
 # init_state = tuple(list(init_state) + elements + ["Periodic Table",])
 # init_state = tuple(list(init_state) + letters + letters2)
 # init_state = tuple(list(init_state) + letters + letters2 + letters3)
@@ -65,14 +87,14 @@ for l1 in letters:
 # best_recipes: dict[str, list[list[tuple[str, str, str]]]] = dict()
 visited = set()
 best_depths: dict[str, int] = dict()
-persistent_file: str = "persistent.json"
-persistent_temporary_file: str = "persistent2.json"
+persistent_file: str = "persistent.json"  # Only read, for resuming runs from before the checkpoint journal
+checkpoint_file: str = "persistent.journal"
 result_directory: str = "Results"
 
 persistent_config = util.load_json("config.json")
 
 recipe_handler: Optional[recipe.RecipeHandler] = recipe.RecipeHandler(init_state, **persistent_config)
-optimal_handler: Optional[optimals.OptimalRecipeStorage] = optimals.OptimalRecipeStorage()
+optimal_handler: Optional[optimals.OptimalRecipeStorage] = optimals.OptimalRecipeWriter()
 depth_limit = 4
 extra_depth = 0
 case_sensitive = True
@@ -80,10 +102,50 @@ allow_starting_elements = False
 resume_last_run = False
 write_to_file = True
 
-last_game_state: Optional['GameState'] = None
-new_last_game_state: Optional['GameState'] = None
-autosave_interval = 500  # Save persistent file every 500 new visited elements
+last_game_state: Optional[list[int]] = None
+new_last_game_state: Optional[list[int] | array] = None
+autosave_interval = 500  # Save persistent file every 500 new visited elements, 0 to disable
 autosave_counter = 0
+checkpoint_journal: Optional[checkpoint.CheckpointJournal] = None
+checkpoint_compact_interval = 1000  # Compact the checkpoint journal after this many saves
+progress_interval = 60  # Seconds between progress reports, 0 to disable
+search_progress: Optional[progress.SearchProgress] = None
+# Only try pairs that are known to craft something, for local-only searches. Worth it for large starting sets
+productive_index = False
+productive_pairs: Optional['ProductivePairs'] = None
+# Goal-directed search, for local-only searches: only look for these items, and stop once they're all found
+goal_targets: Optional[list[str]] = None
+goal_bound: Optional['GoalBound'] = None
+
+collect_stats = False  # Count nodes, pruning and I/O per depth, appended to stats_file as json lines
+stats_file = "stats.jsonl"
+search_stats: Optional[stats.SearchStats] = None
+
+# Prefetching requests for upcoming sibling states when using the API
+prefetch_lookahead = 0  # Number of upcoming siblings to prefetch, 0 to disable
+prefetch_budget = 1000  # Maximum number of pairs being prefetched at once
+prefetcher: Optional['Prefetcher'] = None
+
+# Multiprocessing, only for local-only searches since it's purely CPU-bound
+parallel_workers = 0  # Number of worker processes, 0 to search on a single core
+parallel_prefix_depth = 2  # Depth at which the tree is split into work units
+prefix_units: Optional[list[list[int]]] = None  # If set, dls collects the paths at parallel_prefix_depth instead
+concurrent_subtrees = 1  # Number of subtrees at parallel_prefix_depth searched at once when using the API
+# Batch requests waiting on the API at once. None for one per concurrent subtree, plus one for prefetching,
+# unless max_in_flight_batches is set in config.json
+max_in_flight_batches: Optional[int] = None
+steal_hook: Optional[Callable[['GameState'], None]] = None  # Called at every dls node in parallel workers
+
+# Searching on several machines, split the same way as multiprocessing. See DistributedSearch
+coordinator_address: Optional[tuple[str, int]] = None  # Address to listen on for workers
+worker_address: Optional[tuple[str, int]] = None  # If set, work for the coordinator there instead of searching
+
+# Breadth first search over item sets instead of IDDFS, for local-only searches. Levels are kept on disk
+bfs_engine = False
+bfs_directory = "cache/bfs"
+bfs_chunk_size = 500000  # States sorted in memory at once, before they're written out as a run
+
+batch_file: Optional[str] = None  # If set, run the searches listed in this json file instead, see run_batch
 
 
 @cache
@@ -91,115 +153,263 @@ def limit(n: int) -> int:
     return n * (n + 1) // 2
 
 
-class GameState:
-    items: list[str]
-    state: list[int]
-    visited: list[set[str]]
-    used: list[int]
-    children: set[str]
+# Items are interned to integer IDs so GameState can keep them in flat int arrays.
+# Names are only looked up again when a recipe needs to be printed or saved.
+item_ids: dict[str, int] = {}
+item_names: list[str] = []
 
-    def __init__(self, items: list[str], state: list[int], children: set[str], used: list[int]):
-        self.state = state
-        self.items = items
-        self.children = children
-        self.used = used
+
+def intern_item(name: str) -> int:
+    try:
+        return item_ids[name]
+    except KeyError:
+        item_ids[name] = len(item_names)
+        item_names.append(name)
+        return item_ids[name]
+
+
+class ChildrenLog:
+    """
+    Items that have already been crafted along the current DFS path, shared by the whole search.
+    Each item is stamped with the length of the state that crafted it,
+    so backtracking only has to undo the entries added below that point.
+    """
+    depth_of: dict[int, int]
+    log: list[int]
+
+    def __init__(self):
+        self.depth_of = {}
+        self.log = []
+
+    def __contains__(self, item: int) -> bool:
+        return item in self.depth_of
+
+    def __len__(self):
+        return len(self.log)
+
+    def add(self, item: int, depth: int):
+        self.depth_of[item] = depth
+        self.log.append(item)
+
+    def rollback(self, depth: int):
+        # Remove everything crafted by states of at least this length
+        while self.log and self.depth_of[self.log[-1]] >= depth:
+            del self.depth_of[self.log.pop()]
+
+
+class GameState:
+    """
+    The current path of the DFS.
+    All buffers are preallocated to the depth limit, and a single GameState is shared along the whole path,
+    so crafting pushes onto it and backtracking pops from it instead of copying.
+    Only the first `size` entries are valid. Unused item slots are -1.
+    """
+    items: array   # Item IDs
+    state: array   # Pair index used to craft each item, -1 for starting items
+    used: array    # Number of times each item has been used as an ingredient
+    position: dict[int, int]  # Item ID -> first position it's at, so membership checks don't scan the items
+    size: int
+    children: ChildrenLog
+    # Craft results by pair index, for API searches. A child only adds the row of pairs with its new item,
+    # so this is extended by expand and cut back on pop. None if the pair couldn't be resolved
+    results: list[Optional[str]]
+
+    def __init__(self, items: tuple[str, ...], capacity: int):
+        capacity = max(capacity, len(items))
+        self.items = array('i', [-1] * capacity)
+        self.state = array('i', [-1] * capacity)
+        self.used = array('i', [0] * capacity)
+        self.position = {}
+        for i, item in enumerate(items):
+            self.items[i] = intern_item(item)
+            self.position.setdefault(self.items[i], i)
+        self.size = len(items)
+        self.children = ChildrenLog()
+        self.results = []
 
     def __str__(self):
-        steps = [self.items[-1] + ":"]
-        for i in range(len(self.state)):
+        steps = [self.tail_item() + ":"]
+        for i in range(self.size):
             left, right = int_to_pair(self.state[i])
             if (left < 0) or (right < 0):
                 continue
-            steps.append(f"{self.items[left]} + {self.items[right]} = {self.items[i]}")
+            steps.append(f"{self.item_name(left)} + {self.item_name(right)} = {self.item_name(i)}")
         return "\n".join(steps)
 
     def __repr__(self):
         steps = []
-        for i in range(len(self.state)):
+        for i in range(self.size):
             left, right = int_to_pair(self.state[i])
             if (left < 0) or (right < 0):
                 continue
-            steps.append(f"{self.items[left]}={self.items[right]}={self.items[i]}")
+            steps.append(f"{self.item_name(left)}={self.item_name(right)}={self.item_name(i)}")
         return "=".join(steps) + "=="
 
     def __len__(self):
-        return len(self.state)
+        return self.size
 
     def __eq__(self, other):
-        return self.state == other.state
+        return self.state_list() == other.state_list()
 
     def __lt__(self, other):
-        for i in range(min(len(self.state), len(other.state))):
-            if self.state[i] < other.state[i]:
+        return self.precedes(other.state_list())
+
+    def __hash__(self):
+        return hash(str(self.state_list()))
+
+    def precedes(self, other_state: list[int]) -> bool:
+        for i in range(min(self.size, len(other_state))):
+            if self.state[i] < other_state[i]:
                 return True
-            elif self.state[i] > other.state[i]:
+            elif self.state[i] > other_state[i]:
                 return False
             else:
                 continue
         return False  # If it's the same starting elements, we still need to explore this state
 
-    def __hash__(self):
-        return hash(str(self.state))
+    def state_list(self) -> list[int]:
+        return self.state[:self.size].tolist()
+
+    def item_name(self, i: int) -> str:
+        return item_names[self.items[i]]
+
+    def names(self) -> list[str]:
+        return [item_names[item] for item in self.items[:self.size]]
 
     def to_list(self) -> list[tuple[str, str, str]]:
         l: list[tuple[str, str, str]] = []
-        for i in range(len(self.state)):
+        for i in range(self.size):
             left, right = int_to_pair(self.state[i])
             if (left < 0) or (right < 0):
                 continue
-            l.append((self.items[left], self.items[right], self.items[i]))
+            l.append((self.item_name(left), self.item_name(right), self.item_name(i)))
         return l
 
-    async def child(self, session: aiohttp.ClientSession, i: int) -> Optional['GameState']:
+    async def push(self, session: aiohttp.ClientSession, i: int) -> bool:
+        """
+        Try to craft pair i and push the result onto the path.
+        :return: Whether the craft was valid. If it was, the caller must pop() once done with it.
+        """
         # Invalid indices
-        if i <= self.tail_index() or i >= limit(len(self)):
-            return None
+        if i <= self.tail_index() or i >= limit(self.size):
+            return False
 
-        # Craft the items
+        # Craft the items, if the batch request didn't already
         u, v = int_to_pair(i)
-        craft_result = await recipe_handler.combine(session, self.items[u], self.items[v])
+        craft_result = await self.pair_result(session, i)
+        return self.push_result(i, u, v, craft_result)
 
+    async def pair_result(self, session: aiohttp.ClientSession, i: int) -> str:
+        if i < len(self.results) and self.results[i] is not None:
+            return self.results[i]
+        u, v = int_to_pair(i)
+        craft_result = await recipe_handler.combine(session, self.item_name(u), self.item_name(v))
+        if i < len(self.results):
+            self.results[i] = craft_result
+        return craft_result
+
+    async def resolve_pairs(self, session: aiohttp.ClientSession):
+        """
+        Batch request every pair that isn't in `results` yet. Normally that's just the pairs with the newest item.
+        """
+        items = self.names()
+        pairs = [(items[u], items[v]) for u, v in map(int_to_pair, range(len(self.results), limit(self.size)))]
+        prefetched = {}
+        if prefetcher is not None:
+            prefetched = await prefetcher.wait_for(pairs)
+        results = await recipe_handler.combine_batch(session, [pair for pair in pairs if pair not in prefetched])
+        results = iter(result for _, _, result in results)
+        self.results.extend(prefetched[pair] if pair in prefetched else next(results) for pair in pairs)
+
+    def push_local(self, i: int) -> bool:
+        """
+        Same as push, but only looks at the local cache, without going through asyncio.
+        """
+        # Invalid indices
+        if i <= self.tail_index() or i >= limit(self.size):
+            return False
+
+        # Craft the items
+        u, v = int_to_pair(i)
+        craft_result = recipe_handler.combine_local(self.item_name(u), self.item_name(v))
+        return self.push_result(i, u, v, craft_result)
+
+    def push_result(self, i: int, u: int, v: int, craft_result: Optional[str]) -> bool:
+        result = self.check_result(u, v, craft_result)
+        if result < 0:
+            return False
+        self.append(i, u, v, result)
+        return True
+
+    def check_result(self, u: int, v: int, craft_result: Optional[str]) -> int:
+        """
+        Check whether crafting u + v = craft_result gives a valid child, and mark the result as crafted at this state.
+        :return: The result's item ID, or -1 if the craft is invalid
+        """
         # Invalid crafts / no result
         if craft_result is None or craft_result == "Nothing":
-            return None
+            if search_stats is not None:
+                search_stats.rejected_nothing += 1
+            return -1
+        result = intern_item(craft_result)
 
         # If we don't allow starting elements
-        if not allow_starting_elements and craft_result in self.items:
-            return None
+        if not allow_starting_elements and result in self.position:
+            if search_stats is not None:
+                search_stats.rejected_in_items += 1
+            return -1
 
         # If we allow starting elements to be crafted, such as searching for optimal periodic table entry points
         # We can't craft a used starting element, because that forms a loop.
         if allow_starting_elements:
-            if craft_result == self.items[u] or craft_result == self.items[v]:
-                return None
-            if craft_result in self.items and self.used[self.items.index(craft_result)] != 0:
-                return None
+            if result == self.items[u] or result == self.items[v] or \
+                    (result in self.position and self.used[self.position[result]] != 0):
+                if search_stats is not None:
+                    search_stats.rejected_in_items += 1
+                return -1
 
         # Make sure we never craft this ever again
-        if craft_result in self.children:
-            return None
-        self.children.add(craft_result)
-
-        # Construct the new state
-        new_state = self.state + [i, ]
-        new_items = self.items + [craft_result, ]
-        new_used = self.used.copy()
-        new_used.append(0)
-        new_used[u] += 1
-        new_used[v] += 1
-        return GameState(new_items, new_state, self.children.copy(), new_used)
+        if result in self.children:
+            if search_stats is not None:
+                search_stats.rejected_children += 1
+            return -1
+        self.children.add(result, self.size)
+        return result
+
+    def append(self, i: int, u: int, v: int, result: int):
+        # Push the new item, without any checks
+        self.items[self.size] = result
+        self.state[self.size] = i
+        self.used[u] += 1
+        self.used[v] += 1
+        # Starting elements can be crafted again, and keep their first position
+        self.position.setdefault(result, self.size)
+        self.size += 1
+
+    def pop(self):
+        self.children.rollback(self.size)
+        self.size -= 1
+        u, v = int_to_pair(self.state[self.size])
+        self.used[u] -= 1
+        self.used[v] -= 1
+        if self.position[self.items[self.size]] == self.size:
+            del self.position[self.items[self.size]]
+        self.items[self.size] = -1
+        self.state[self.size] = -1
+        if len(self.results) > limit(self.size):
+            del self.results[limit(self.size):]
 
     def unused_items(self) -> list[int]:
-        return [i for i in range(len(init_state), len(self.items)) if 0 == self.used[i]]
+        return [i for i in range(len(init_state), self.size) if 0 == self.used[i]]
 
     def items_set(self) -> frozenset[str]:
-        return frozenset(self.items)
+        return frozenset(self.names())
 
     def tail_item(self) -> str:
-        return self.items[-1]
+        return self.item_name(self.size - 1)
 
     def tail_index(self) -> int:
-        return self.state[-1]
+        return self.state[self.size - 1]
 
 
 def save_optimal_recipe(state: GameState):
@@ -207,92 +417,1153 @@ def save_optimal_recipe(state: GameState):
     optimal_handler.add_optimal(state.tail_item(), repr(state))
 
 
-def process_node(state: GameState):
+def record_best_depth(item: str, depth: int):
     global autosave_counter
 
-    tail_item = state.tail_item()
+    visited_item = item
     if not case_sensitive:
-        tail_item = tail_item.upper()
+        visited_item = visited_item.upper()
 
-    if tail_item not in visited:
-        visited.add(tail_item)
+    if visited_item not in visited:
+        visited.add(visited_item)
         autosave_counter += 1
-        if autosave_counter >= autosave_interval:
+        if autosave_interval and autosave_counter >= autosave_interval:
             autosave_counter = 0
             save_last_state()
 
     # Multiple recipes for the same item at same depth
-    depth = len(state) - len(init_state)
-    if state.tail_item() not in best_depths:
-        best_depths[state.tail_item()] = depth
+    if item not in best_depths:
+        best_depths[item] = depth
+
 
-    if write_to_file and depth <= best_depths[state.tail_item()] + extra_depth:
+class UnitOutput:
+    """
+    Everything process_node produces for one unit of work, for units that don't run in DFS order.
+    Merging the outputs back in DFS order gives the same results as searching the units one by one.
+    """
+    best_depths: dict[str, int]  # Items not in the global best_depths
+    optimals: list[tuple[str, str]]
+    last_leaf: Optional[array]
+    leaves: int
+    stats: Optional[stats.SearchStats]  # Only for units searched by parallel workers
+
+    def __init__(self):
+        self.best_depths = {}
+        self.optimals = []
+        self.last_leaf = None
+        self.leaves = 0
+        self.stats = None
+
+    def record_leaf(self, path: array, tail_item: str, depth: int) -> bool:
+        self.last_leaf = path
+        self.leaves += 1
+        if goal_bound is not None and not goal_bound.is_target(tail_item):
+            return False
+        if tail_item not in best_depths and tail_item not in self.best_depths:
+            self.best_depths[tail_item] = depth
+
+        return write_to_file and depth <= best_depths.get(tail_item, depth) + extra_depth
+
+    def merge(self):
+        global new_last_game_state
+
+        for item, depth in self.best_depths.items():
+            record_best_depth(item, depth)
+        for name, optimal in self.optimals:
+            optimal_handler.add_optimal(name, optimal)
+        # Only move the checkpoint once everything in this unit is recorded
+        if self.last_leaf is not None:
+            new_last_game_state = self.last_leaf
+        if search_progress is not None:
+            search_progress.advance(self.leaves, new_last_game_state)
+        if search_stats is not None and self.stats is not None:
+            search_stats.merge(self.stats)
+
+    def to_dict(self) -> dict:
+        return {
+            "best_depths": self.best_depths,
+            "optimals": self.optimals,
+            "last_leaf": None if self.last_leaf is None else self.last_leaf.tolist(),
+            "leaves": self.leaves,
+            "stats": None if self.stats is None else vars(self.stats),
+        }
+
+    @staticmethod
+    def from_dict(d: dict) -> 'UnitOutput':
+        output = UnitOutput()
+        output.best_depths = d["best_depths"]
+        output.optimals = [tuple(optimal) for optimal in d["optimals"]]
+        if d["last_leaf"] is not None:
+            output.last_leaf = array('i', d["last_leaf"])
+        output.leaves = d["leaves"]
+        if d["stats"] is not None:
+            output.stats = stats.SearchStats()
+            vars(output.stats).update(d["stats"])
+        return output
+
+
+# The output of the unit of work the current task or process is searching, if it isn't searched in DFS order
+unit_output: ContextVar[Optional[UnitOutput]] = ContextVar("unit_output", default=None)
+
+
+def record_leaf(path: array, tail_item: str, depth: int) -> bool:
+    """
+    Record a leaf of the search. Shared by process_node and leaf_layer, which doesn't push its leaves.
+    :param path: The pair indices of the leaf. May be reused for the next leaf once this one is done
+    :param tail_item: The item crafted last
+    :param depth: The number of crafts
+    :return: Whether the leaf's recipe should be saved
+    """
+    global new_last_game_state
+
+    if search_stats is not None:
+        search_stats.leaves += 1
+    output = unit_output.get()
+    if output is not None:
+        return output.record_leaf(path, tail_item, depth)
+
+    new_last_game_state = path
+    if search_progress is not None:
+        search_progress.advance(1, path)
+    # Everything else was pruned along the way, so its depth means nothing
+    if goal_bound is not None and not goal_bound.is_target(tail_item):
+        return False
+    record_best_depth(tail_item, depth)
+    return write_to_file and depth <= best_depths[tail_item] + extra_depth
+
+
+def save_leaf_recipe(state: GameState):
+    output = unit_output.get()
+    if output is not None:
+        output.optimals.append((state.tail_item(), repr(state)))
+    else:
         save_optimal_recipe(state)
 
 
-# Depth limited search
-async def dls(session: aiohttp.ClientSession, state: GameState, depth: int) -> int:
+def process_node(state: GameState):
+    if record_leaf(state.state[:state.size], state.tail_item(), len(state) - len(init_state)):
+        save_leaf_recipe(state)
+
+
+def leaf_layer(state: GameState, candidates: Sequence[int], crafts: Sequence[Optional[str]],
+               lower: int = 0, upper: Optional[int] = None) -> int:
     """
-    Depth limited search
-    :param session: The session to use
+    Process all children of a state with one craft left, without visiting them one by one.
+    Leaves are only pushed if their recipe needs to be saved.
     :param state: The current state
-    :param depth: The depth remaining
+    :param candidates: child_indices(state, 1)
+    :param crafts: The craft result of each candidate
+    :param lower: Only process children with pair index at least this
+    :param upper: Only process children with pair index less than this
     :return: The number of states processed
     """
-    global last_game_state, new_last_game_state
+    if upper is None:
+        upper = limit(len(state))
+
+    tail_index = state.tail_index()
+    depth = len(state) + 1 - len(init_state)
+    path = state.state[:state.size]
+    path.append(-1)
+    count = 0
+    for i, craft_result in zip(candidates, crafts):
+        if i >= upper:
+            break
+        if i <= tail_index:
+            continue
+        u, v = int_to_pair(i)
+        # Still checked below lower, so that `children` matches
+        result = state.check_result(u, v, craft_result)
+        if result < 0 or i < lower:
+            continue
+
+        count += 1
+        path[-1] = i
+        if record_leaf(path, item_names[result], depth):
+            state.append(i, u, v, result)
+            save_leaf_recipe(state)
+            state.pop()
+
+    return count
 
-    # Resuming
-    if last_game_state is not None and len(last_game_state) >= len(state) + depth and state < last_game_state:
-        # print(f"Skipping state {state}")
-        return 0
 
+class ProductivePairs:
+    """
+    For each item, the items it crafts something with according to the local cache.
+    In a local-only search every other pair gives Nothing, so dls only needs to try these.
+    The starting items are looked up once, so a node only has to look at the items crafted after them.
+    """
+    partners: dict[str, set[str]]  # Database name -> partners with a non-Nothing result
+    keys: dict[str, str]  # Item name -> database name
+    init_keys: list[str]
+    init_positions: dict[str, list[int]]
+
+    def __init__(self, partners: dict[str, set[str]], init_items: Sequence[str]):
+        self.partners = partners
+        self.keys = {}
+        self.init_keys = [self.key(item) for item in init_items]
+        self.init_positions = {}
+        for i, key in enumerate(self.init_keys):
+            self.init_positions.setdefault(key, []).append(i)
+
+    def key(self, name: str) -> str:
+        try:
+            return self.keys[name]
+        except KeyError:
+            self.keys[name] = util.to_start_case(name)
+            return self.keys[name]
+
+    def is_productive(self, a: str, b: str) -> bool:
+        return self.key(b) in self.partners.get(self.key(a), ())
+
+    def indices(self, state: GameState, start: int) -> list[int]:
+        """
+        The productive pair indices of a state, from start on, in increasing order.
+        """
+        n = len(state)
+        init_size = len(self.init_keys)
+        keys = self.init_keys + [self.key(state.item_name(i)) for i in range(init_size, n)]
+        crafted_positions: dict[str, list[int]] = {}
+        for i in range(init_size, n):
+            crafted_positions.setdefault(keys[i], []).append(i)
+
+        indices = []
+        # Pair indices are ordered by the larger position first
+        for v in range(int_to_pair(start)[1], n):
+            partners = self.partners.get(keys[v])
+            if not partners:
+                continue
+            if len(partners) > v:
+                us = [u for u in range(v + 1) if keys[u] in partners]
+            else:
+                us = []
+                for partner in partners:
+                    us.extend(u for u in self.init_positions.get(partner, ()) if u <= v)
+                    us.extend(u for u in crafted_positions.get(partner, ()) if u <= v)
+                us.sort()
+            indices.extend(i for i in map(pair_to_int, us, [v] * len(us)) if i >= start)
+        return indices
+
+
+class GoalBound:
+    """
+    Lower bound on the crafts left to reach a set of target items, for goal-directed searches.
+    Generations are computed over the local cache the same way as OptimizerRecipeList.generate_generations:
+    starting items are generation 0, and a craft is one more than its highest ingredient.
+    An item of generation t is at least t - g crafts away from a state whose items are all of generation <= g,
+    so a node is pruned if every target still searched for is further than the depth remaining.
+    """
+    generations: dict[str, int]  # Database name -> generation
+    item_generations: dict[int, int]  # Item ID -> generation
+    targets: dict[str, str]  # Database name -> target, as given
+    matches: dict[str, bool]  # Item name -> whether it's a target
+    min_generation: int  # Lowest generation of the targets still searched for
+
+    def __init__(self, recipes: list[tuple[str, str, str]], init_items: Sequence[str], targets: Sequence[str]):
+        self.generations = self.generate_generations(recipes, init_items)
+        self.item_generations = {}
+        self.targets = {}
+        for target in targets:
+            key = util.to_start_case(target)
+            if key in self.generations:
+                self.targets[key] = target
+            else:
+                print(f"{target} can't be crafted from the local cache, skipping it.")
+        self.matches = {}
+        self.min_generation = 0
+
+    @staticmethod
+    def generate_generations(recipes: list[tuple[str, str, str]], init_items: Sequence[str]) -> dict[str, int]:
+        uses: dict[str, list[tuple[str, str]]] = {}  # Ingredient -> (other ingredient, result)
+        for a, b, result in recipes:
+            result = util.to_start_case(result)
+            uses.setdefault(a, []).append((b, result))
+            if a != b:
+                uses.setdefault(b, []).append((a, result))
+
+        # Breadth first, so the first generation an item gets is its lowest
+        generations = {util.to_start_case(item): 0 for item in init_items}
+        queue = deque(generations)
+        processed = set()
+        while queue:
+            item = queue.popleft()
+            processed.add(item)
+            # Only crafts with processed items, the rest are seen again when the other ingredient is processed
+            for other, result in uses.get(item, ()):
+                if other in processed and result not in generations:
+                    generations[result] = generations[item] + 1
+                    queue.append(result)
+        return generations
+
+    def generation(self, item: int) -> int:
+        try:
+            return self.item_generations[item]
+        except KeyError:
+            # Not in the cache at all, so there's nothing to bound it with. No item is above len(generations)
+            generation = self.generations.get(util.to_start_case(item_names[item]), len(self.generations))
+            self.item_generations[item] = generation
+            return generation
+
+    def is_target(self, name: str) -> bool:
+        try:
+            return self.matches[name]
+        except KeyError:
+            self.matches[name] = util.to_start_case(name) in self.targets
+            return self.matches[name]
+
+    def start_depth(self, depth: int) -> bool:
+        """
+        Work out which targets are still searched for at this depth.
+        :return: Whether there are any left
+        """
+        found = {}
+        for item, item_depth in best_depths.items():
+            key = util.to_start_case(item)
+            if key in self.targets:
+                found[key] = min(item_depth, found.get(key, item_depth))
+        remaining = [self.generations[key] for key in self.targets
+                     if key not in found or found[key] + extra_depth >= depth]
+        if not remaining:
+            return False
+        self.min_generation = min(remaining)
+        return True
+
+    def prunes(self, state: GameState, depth: int) -> bool:
+        highest = 0
+        for i in range(len(init_state), state.size):
+            highest = max(highest, self.generation(state.items[i]))
+        return highest + depth < self.min_generation
+
+
+def child_indices(state: GameState, depth: int) -> Sequence[int]:
+    """
+    The pair indices that dls tries from a state, in increasing order.
+    :param state: The current state
+    :param depth: The depth remaining
+    """
+    # Anything up to the last craft's index would be out of order
+    lower_limit = state.tail_index() + 1
+    if depth == 1 and state.tail_index() != -1:  # Must use the 2nd last element, if it's not a default item.
+        lower_limit = max(lower_limit, limit(len(state) - 1))
+
+    unused_items = state.unused_items()  # Unused items
+    if len(unused_items) > depth + 1:  # Impossible to use all elements, since we have too few crafts left
+        if search_stats is not None:
+            search_stats.rejected_unused += max(0, limit(len(state)) - lower_limit)
+        return ()
+    elif len(unused_items) > depth:  # We must start using unused elements NOW.
+        # For loop ordering is important. We want increasing pair_to_int order.
+        # i != j. We have to use two for unused_items to decrease.
+        forced = [pair_to_int(unused_items[i], unused_items[j]) for j in range(len(unused_items)) for i in range(j)]
+        if search_stats is not None:
+            # Only the children the regular search would have tried
+            search_stats.rejected_unused += max(0, limit(len(state)) - lower_limit) - \
+                sum(1 for i in forced if i >= lower_limit)
+        if productive_pairs is not None:
+            forced = [i for i in forced if productive_pairs.is_productive(*map(state.item_name, int_to_pair(i)))]
+        return forced
+
+    if productive_pairs is not None:
+        return productive_pairs.indices(state, lower_limit)
+    return range(lower_limit, limit(len(state)))  # Regular ol' searching
+
+
+class SearchFrame:
+    """
+    The children of a dls node that are still to be explored.
+    Parallel workers can lower `upper` at any time to give the rest of the frame away.
+    """
+    level: int  # Length of the state
+    depth: int  # Depth remaining
+    candidates: Sequence[int]
+    pos: int
+    lower: int
+    upper: int
+    prefetched: int  # Last position the prefetcher has looked at
+
+    def __init__(self, level: int, depth: int, candidates: Sequence[int], lower: int, upper: int):
+        self.level = level
+        self.depth = depth
+        self.candidates = candidates
+        self.pos = -1
+        self.lower = lower
+        self.upper = upper
+        self.prefetched = -1
+
+    def advance(self) -> Optional[int]:
+        self.pos += 1
+        if self.pos < len(self.candidates) and self.candidates[self.pos] < self.upper:
+            return self.candidates[self.pos]
+        return None
+
+    def next_candidate(self) -> Optional[int]:
+        if self.pos + 1 < len(self.candidates) and self.candidates[self.pos + 1] < self.upper:
+            return self.candidates[self.pos + 1]
+        return None
+
+
+class SearchStack:
+    """
+    The explicit stack of an iterative dls. There's one frame per open node along the current path,
+    so the search can be inspected at any point without unwinding anything.
+    """
+    state: GameState
+    root: int  # Length of the state the search started from
+    frames: list[SearchFrame]
+    count: int  # States processed so far
+
+    def __init__(self, state: GameState):
+        self.state = state
+        self.root = len(state)
+        self.frames = []
+        self.count = 0
+
+    def open(self, depth: int, lower: int = 0, upper: Optional[int] = None):
+        state = self.state
+        self.frames.append(SearchFrame(len(state), depth, child_indices(state, depth), lower,
+                                       limit(len(state)) if upper is None else upper))
+
+    def close(self):
+        self.frames.pop()
+        # Every frame but the root's was opened on a pushed child
+        if self.frames:
+            self.state.pop()
+
+    def position(self) -> list[int]:
+        """
+        The pair indices from the start of the search to the child being explored in the deepest frame.
+        Searching resumes exactly here by seeking to it, and it's a plain list so it can be saved as is.
+        """
+        return [frame.candidates[frame.pos] for frame in self.frames if frame.pos >= 0]
+
+
+# The dls running in the current task or process
+current_search: ContextVar[Optional[SearchStack]] = ContextVar("current_search", default=None)
+
+
+async def seek(session: aiohttp.ClientSession, state: GameState, path: list[int], depth: int) -> int:
+    """
+    Craft along a path the same way dls gets there, including the earlier siblings at every level,
+    so that `state.children` is the same as in the full search.
+    :param session: The session to use
+    :param state: The state to craft from
+    :param path: The pair indices crafted after the starting items
+    :param depth: The depth remaining at the start of the path
+    :return: The depth remaining at the end of the path
+    """
+    for i in path:
+        for j in child_indices(state, depth):
+            if j >= i:
+                break
+            if await state.push(session, j):
+                state.pop()
+        if not await state.push(session, i):
+            raise ValueError(f"Invalid path {path} for state {state.state_list()}")
+        depth -= 1
+    return depth
+
+
+class Prefetcher:
+    """
+    Requests the pairs that upcoming sibling states will batch request, in the background,
+    so that the API latency is off the critical path of the search.
+    The results of the upcoming crafts are already cached by the parent's batch request,
+    so the only unknown pairs of a sibling are its new item with every item.
+    """
+    pending: dict[tuple[str, str], asyncio.Task]  # Pairs being prefetched
+    results: dict[tuple[str, str], str]  # Prefetched pairs not used yet, including Nothing, which isn't saved
+    in_flight: int  # Number of pairs being prefetched
+
+    def __init__(self):
+        self.pending = {}
+        self.results = {}
+        self.in_flight = 0
+
+    def schedule(self, session: aiohttp.ClientSession, state: GameState, frame: SearchFrame):
+        # Look at the next few children of the frame, that haven't been looked at yet
+        end = min(frame.pos + prefetch_lookahead, len(frame.candidates) - 1)
+        while frame.prefetched < end:
+            frame.prefetched += 1
+            i = frame.candidates[frame.prefetched]
+            if i >= frame.upper:
+                break
+            if frame.prefetched > frame.pos:
+                self.schedule_child(session, state, i)
+
+    def schedule_child(self, session: aiohttp.ClientSession, state: GameState, i: int):
+        if i <= state.tail_index():
+            return
+        u, v = int_to_pair(i)
+        craft_result = recipe_handler.get_local(state.item_name(u), state.item_name(v))
+        # Unknown or invalid craft, or the child won't batch request anything
+        if recipe_handler.needs_request(craft_result) or recipe_handler.is_nothing(craft_result):
+            return
+        if len(craft_result) > recipe.WORD_COMBINE_CHAR_LIMIT:
+            return
+        result = item_ids.get(craft_result)
+        if result is not None and (result in state.position or result in state.children):
+            return
+
+        pairs = [(item, craft_result) for item in state.names()] + [(craft_result, craft_result)]
+        need_request = [pair for pair in dict.fromkeys(pairs)
+                        if pair not in self.pending and pair not in self.results and
+                        recipe_handler.needs_request(recipe_handler.get_local(*pair))]
+        if not need_request or self.in_flight + len(need_request) > prefetch_budget:
+            return
+
+        # Counted right away, since the task only starts at the next await, after the rest of this pass
+        self.in_flight += len(need_request)
+        task = asyncio.create_task(self.fetch(session, need_request))
+        task.add_done_callback(lambda _: self.finished(need_request))
+        for pair in need_request:
+            self.pending[pair] = task
+
+    async def fetch(self, session: aiohttp.ClientSession, pairs: list[tuple[str, str]]):
+        # combine_batch appends to the list for re-requests
+        for a, b, result in await recipe_handler.combine_batch(session, pairs.copy(), check_local=False):
+            self.results[(a, b)] = result
+
+    def finished(self, pairs: list[tuple[str, str]]):
+        # Also called if the task was cancelled before it started
+        self.in_flight -= len(pairs)
+        for pair in pairs:
+            del self.pending[pair]
+
+    async def wait_for(self, pairs: list[tuple[str, str]]) -> dict[tuple[str, str], str]:
+        """
+        Wait for the pairs that are being prefetched.
+        :return: The results of the pairs that were prefetched, which aren't kept any longer
+        """
+        tasks = {self.pending[pair] for pair in pairs if pair in self.pending}
+        if tasks:
+            await asyncio.gather(*tasks)
+        return {pair: self.results.pop(pair) for pair in pairs if pair in self.results}
+
+    async def drain(self):
+        await asyncio.gather(*set(self.pending.values()))
+        # Results of siblings that were never searched
+        self.results.clear()
+
+
+def seek_local(state: GameState, path: list[int], depth: int) -> int:
+    """
+    Same as seek, using the local cache only.
+    """
+    for i in path:
+        for j in child_indices(state, depth):
+            if j >= i:
+                break
+            if state.push_local(j):
+                state.pop()
+        if not state.push_local(i):
+            raise ValueError(f"Invalid path {path} for state {state.state_list()}")
+        depth -= 1
+    return depth
+
+
+def visit_node(state: GameState, depth: int) -> Optional[int]:
+    """
+    Everything dls does at a node before looking at its children.
+    :return: The number of states processed if the node is done, or None if its children need to be searched
+    """
     if depth == 0:  # We've reached the end of the crafts, process the node
-        new_last_game_state = state
         process_node(state)
         return 1
 
+    # Splitting the tree into work units for parallel workers
+    if prefix_units is not None and len(state) - len(init_state) == parallel_prefix_depth:
+        prefix_units.append(state.state[len(init_state):state.size].tolist())
+        return 0
+
     # 30 char limit, according to PB and laurasia
     if len(state.tail_item()) > recipe.WORD_COMBINE_CHAR_LIMIT:
+        if search_stats is not None:
+            search_stats.rejected_char_limit += 1
         return 0
 
     # Even if we allowed starting element results, we're still not going to continue from such a state
-    if allow_starting_elements and state.tail_item() in state.items[:-1]:
+    if allow_starting_elements and state.position[state.items[state.size - 1]] != state.size - 1:
         return 0
 
-    # Batch request all possible combinations at this state
-    # so that we cache it
-    # Very simple way to implement batching so that I can start requesting again
-    # before pitching to writing my own state queue
-
-    request_list = []
-    for i, u in enumerate(state.items):
-        for j, v in enumerate(state.items):
-            if i <= j:
-                request_list.append((u, v))
-    # First do the batch requests
-    await recipe_handler.combine_batch(session, request_list)
-
-    count = 0  # States counter
-    unused_items = state.unused_items()  # Unused items
-    if len(unused_items) > depth + 1:  # Impossible to use all elements, since we have too few crafts left
+    if goal_bound is not None and goal_bound.prunes(state, depth):
+        if search_stats is not None:
+            search_stats.rejected_goal += 1
         return 0
-    elif len(unused_items) > depth:  # We must start using unused elements NOW.
-        for j in range(len(unused_items)):  # For loop ordering is important. We want increasing pair_to_int order.
-            for i in range(j):  # i != j. We have to use two for unused_items to decrease.
-                child = await state.child(session, pair_to_int(unused_items[i], unused_items[j]))
-                if child is not None:
-                    count += await dls(session, child, depth - 1)
+
+    if steal_hook is not None:
+        steal_hook(state)
+
+    return None
+
+
+async def expand(session: aiohttp.ClientSession, search: SearchStack, depth: int,
+                 lower: int = 0, upper: Optional[int] = None, cursor: Sequence[int] = ()) -> Optional[int]:
+    """
+    Everything dls does when it enters a node. The last layer is processed right away,
+    otherwise a frame is opened for the node's children.
+    :param cursor: If set, skip straight to this path below the node, and carry on from there
+    :return: The number of states processed, or None if a frame was opened
+    """
+    state = search.state
+    count = visit_node(state, depth)
+    if count is not None:
+        return count
+    if search_stats is not None:
+        search_stats.nodes_expanded += 1
+    if len(cursor) == 1:
+        lower = max(lower, cursor[0])
+
+    # Batch request all possible combinations at this state
+    # so that we cache it. The parent already has all but the new item's
+    await state.resolve_pairs(session)
+
+    if depth == 1:
+        # The batch already has every craft of the last layer
+        candidates = child_indices(state, depth)
+        leaf_crafts = [await state.pair_result(session, i) for i in candidates]
+        return leaf_layer(state, candidates, leaf_crafts, lower, upper)
+
+    search.open(depth, lower, upper)
+    if len(cursor) > 1:
+        await seek_cursor(session, search, cursor)
+    return None
+
+
+async def seek_cursor(session: aiohttp.ClientSession, search: SearchStack, cursor: Sequence[int]):
+    """
+    Move the deepest frame to the start of the cursor, and open the frames along the rest of it.
+    Earlier siblings are still crafted so that `children` matches, but nothing below them is searched.
+    """
+    state = search.state
+    frame = search.frames[-1]
+    while (i := frame.advance()) is not None and i < cursor[0]:
+        if await state.push(session, i):
+            state.pop()
+
+    if i == cursor[0] and i >= frame.lower and await state.push(session, i):
+        count = await expand(session, search, frame.depth - 1, cursor=cursor[1:])
+        if count is not None:
+            search.count += count
+            state.pop()
     else:
-        lower_limit = 0
-        if depth == 1 and state.tail_index() != -1:  # Must use the 2nd last element, if it's not a default item.
-            lower_limit = limit(len(state) - 1)
+        # The cursor isn't a valid child anymore, carry on from the next one
+        frame.pos -= 1
 
-        for i in range(lower_limit, limit(len(state))):  # Regular ol' searching
-            child = await state.child(session, i)
-            if child is not None:
-                count += await dls(session, child, depth - 1)
 
-    return count
+# Depth limited search
+async def dls(session: aiohttp.ClientSession, state: GameState, depth: int,
+              lower: int = 0, upper: Optional[int] = None, cursor: Sequence[int] = ()) -> int:
+    """
+    Depth limited search, iterating over an explicit stack instead of recursing.
+    :param session: The session to use
+    :param state: The current state
+    :param depth: The depth remaining
+    :param lower: Only explore children with pair index at least this
+    :param upper: Only explore children with pair index less than this
+    :param cursor: Resume from this path below the state, skipping everything before it
+    :return: The number of states processed
+    """
+    search = SearchStack(state)
+    token = current_search.set(search)
+    try:
+        count = await expand(session, search, depth, lower, upper, cursor)
+        if count is not None:
+            return count
+
+        while search.frames:
+            frame = search.frames[-1]
+            i = frame.advance()
+            if i is None:
+                search.close()
+                continue
+            if i < frame.lower:
+                # Part of someone else's work, but still crafted so that `children` matches
+                if await state.push(session, i):
+                    state.pop()
+                continue
+            if prefetcher is not None and frame.depth > 1:  # Leaves don't batch request
+                prefetcher.schedule(session, state, frame)
+            if await state.push(session, i):
+                count = await expand(session, search, frame.depth - 1)
+                if count is not None:
+                    search.count += count
+                    state.pop()
+        return search.count
+    finally:
+        current_search.reset(token)
+
+
+def expand_local(search: SearchStack, depth: int, lower: int = 0, upper: Optional[int] = None,
+                 cursor: Sequence[int] = ()) -> Optional[int]:
+    """
+    Same as expand, for local-only searches.
+    """
+    state = search.state
+    count = visit_node(state, depth)
+    if count is not None:
+        return count
+    if search_stats is not None:
+        search_stats.nodes_expanded += 1
+    if len(cursor) == 1:
+        lower = max(lower, cursor[0])
+
+    if depth == 1:
+        candidates = child_indices(state, depth)
+        items = state.names()
+        crafts = recipe_handler.combine_local_batch([(items[u], items[v]) for u, v in map(int_to_pair, candidates)])
+        return leaf_layer(state, candidates, crafts, lower, upper)
+
+    search.open(depth, lower, upper)
+    if len(cursor) > 1:
+        seek_cursor_local(search, cursor)
+    return None
+
+
+def seek_cursor_local(search: SearchStack, cursor: Sequence[int]):
+    """
+    Same as seek_cursor, using the local cache only.
+    """
+    state = search.state
+    frame = search.frames[-1]
+    while (i := frame.advance()) is not None and i < cursor[0]:
+        if state.push_local(i):
+            state.pop()
+
+    if i == cursor[0] and i >= frame.lower and state.push_local(i):
+        count = expand_local(search, frame.depth - 1, cursor=cursor[1:])
+        if count is not None:
+            search.count += count
+            state.pop()
+    else:
+        frame.pos -= 1
+
+
+def dls_local(state: GameState, depth: int, lower: int = 0, upper: Optional[int] = None,
+              cursor: Sequence[int] = ()) -> int:
+    """
+    Same as dls, for local-only searches. Everything is a plain function call, so there's no coroutine overhead,
+    and nothing needs to be batch requested.
+    """
+    search = SearchStack(state)
+    token = current_search.set(search)
+    try:
+        count = expand_local(search, depth, lower, upper, cursor)
+        if count is not None:
+            return count
+
+        while search.frames:
+            frame = search.frames[-1]
+            i = frame.advance()
+            if i is None:
+                search.close()
+                continue
+            if i < frame.lower:
+                # Part of someone else's work, but still crafted so that `children` matches
+                if state.push_local(i):
+                    state.pop()
+                continue
+            if state.push_local(i):
+                count = expand_local(search, frame.depth - 1)
+                if count is not None:
+                    search.count += count
+                    state.pop()
+        return search.count
+    finally:
+        current_search.reset(token)
+
+
+class ParallelSearch:
+    """
+    Runs dls on worker processes, for local-only searches.
+    The tree is split into subtrees at parallel_prefix_depth. Once those run out,
+    a busy worker is asked to give away the unexplored part of its shallowest open frame.
+    Results are merged back in DFS order, so the output is identical to a single-core run.
+    """
+    inboxes: list[multiprocessing.Queue]
+    outbox: multiprocessing.Queue
+    steal_flags: Sequence[int]
+    workers: list[multiprocessing.Process]
+    synced_best_depths: int
+    poll_interval: float = 1.0  # Seconds between checks that the workers are still alive
+
+    def __init__(self, num_workers: int):
+        # Always spawn, since sqlite connections can't be shared across a fork
+        ctx = multiprocessing.get_context("spawn")
+        self.inboxes = [ctx.Queue() for _ in range(num_workers)]
+        self.outbox = ctx.Queue()
+        self.steal_flags = ctx.RawArray('b', num_workers)
+        config = worker_config()
+        config["last_game_state"] = last_game_state
+        config["best_depths"] = best_depths
+        self.workers = [ctx.Process(target=parallel_worker,
+                                    args=(i, self.inboxes[i], self.outbox, self.steal_flags, config),
+                                    daemon=True)
+                        for i in range(num_workers)]
+        for worker in self.workers:
+            worker.start()
+        self.synced_best_depths = len(best_depths)
+
+    def run_depth(self, depth: int, prefixes: list[list[int]]) -> int:
+        # Send over everything found since the last depth
+        new_best_depths = newest_best_depths(len(best_depths) - self.synced_best_depths)
+        self.synced_best_depths = len(best_depths)
+        for inbox in self.inboxes:
+            inbox.put(("depth", depth, new_best_depths))
+
+        # Units are (path, lower, upper), ordered by path + [lower], which is also DFS order
+        queue = deque((prefix, 0, None) for prefix in prefixes)
+        order = [tuple(prefix) + (0,) for prefix in prefixes]
+        results = {}
+        idle = list(range(len(self.workers)))
+        running: dict[int, tuple] = {}
+        asked = set()  # Workers with an unanswered steal request
+        declined = set()  # Workers with nothing left to give away for their current unit
+        count = 0
+
+        while order:
+            while queue and idle:
+                worker = idle.pop()
+                unit = queue.popleft()
+                running[worker] = unit
+                declined.discard(worker)
+                self.inboxes[worker].put(("unit",) + unit)
+
+            if not queue:
+                for worker in running:
+                    if len(asked) >= len(idle):
+                        break
+                    if worker not in asked and worker not in declined:
+                        asked.add(worker)
+                        self.steal_flags[worker] = 1
+
+            message = self.receive()
+            if message[0] == "split":
+                _, worker, unit = message
+                asked.discard(worker)
+                if unit is None:
+                    declined.add(worker)
+                    continue
+                bisect.insort(order, tuple(unit[0]) + (unit[1],))
+                queue.append(unit)
+                continue
+
+            _, worker, unit_count, output = message
+            path, lower, _ = running.pop(worker)
+            idle.append(worker)
+            results[tuple(path) + (lower,)] = (unit_count, output)
+
+            # Merge everything that's complete, in order
+            while order and order[0] in results:
+                unit_count, output = results.pop(order.pop(0))
+                count += unit_count
+                output.merge()
+
+        return count
+
+    def receive(self) -> tuple:
+        """
+        The next message from the workers. Raises if a worker failed, instead of waiting for it forever.
+        """
+        while True:
+            try:
+                message = self.outbox.get(timeout=self.poll_interval)
+            except Empty:
+                for i, worker in enumerate(self.workers):
+                    if not worker.is_alive():
+                        raise RuntimeError(f"Parallel worker {i} died with exit code {worker.exitcode}")
+                continue
+            if message[0] == "error":
+                _, worker, error = message
+                raise RuntimeError(f"Parallel worker {worker} failed:\n{error}")
+            return message
+
+    def close(self):
+        for inbox in self.inboxes:
+            inbox.put(None)
+        for worker in self.workers:
+            # If the search was interrupted, a worker can still be busy with a unit whose results will never be read
+            worker.join(timeout=1)
+            if worker.is_alive():
+                worker.terminate()
+                worker.join()
+
+
+def newest_best_depths(n: int) -> list[tuple[str, int]]:
+    # Dictionaries keep insertion order, so the newest entries are at the end
+    entries = list(islice(reversed(best_depths.items()), n))
+    entries.reverse()
+    return entries
+
+
+def worker_config() -> dict:
+    """
+    The settings a worker needs to search the same way as this process.
+    """
+    return {
+        "init_state": init_state,
+        "case_sensitive": case_sensitive,
+        "allow_starting_elements": allow_starting_elements,
+        "extra_depth": extra_depth,
+        "write_to_file": write_to_file,
+        "collect_stats": collect_stats,
+        "productive_index": productive_pairs is not None,
+        "goal_targets": None if goal_bound is None else list(goal_bound.targets.values()),
+    }
+
+
+def apply_worker_config(config: dict):
+    global init_state, case_sensitive, allow_starting_elements, extra_depth, write_to_file, collect_stats, \
+        productive_pairs, goal_bound
+
+    init_state = tuple(config["init_state"])
+    case_sensitive = config["case_sensitive"]
+    allow_starting_elements = config["allow_starting_elements"]
+    extra_depth = config["extra_depth"]
+    write_to_file = config["write_to_file"]
+    collect_stats = config["collect_stats"]
+    if config["productive_index"]:
+        productive_pairs = ProductivePairs(recipe_handler.get_productive_pairs(), init_state)
+    if config["goal_targets"] is not None:
+        goal_bound = GoalBound(recipe_handler.get_local_recipes(), init_state, config["goal_targets"])
+
+
+def parallel_worker(index: int, inbox: multiprocessing.Queue, outbox: multiprocessing.Queue,
+                    steal_flags: Sequence[int], config: dict):
+    global last_game_state, best_depths, steal_hook
+
+    apply_worker_config(config)
+    last_game_state = config["last_game_state"]
+    best_depths = config["best_depths"]
+    # The main process saves progress
+    atexit.unregister(save_last_state)
+
+    def give_away_work(state: GameState):
+        if not steal_flags[index]:
+            return
+        steal_flags[index] = 0
+        # Give away the rest of the shallowest frame, which is likely the most work
+        for frame in current_search.get().frames:
+            lower = frame.next_candidate()
+            if lower is not None:
+                path = state.state[len(init_state):frame.level].tolist()
+                outbox.put(("split", index, (path, lower, frame.upper)))
+                frame.upper = lower
+                return
+        outbox.put(("split", index, None))
+
+    steal_hook = give_away_work
+    try:
+        parallel_worker_loop(index, inbox, outbox, steal_flags)
+    except Exception:
+        # Let the main process know, instead of leaving it waiting
+        outbox.put(("error", index, traceback.format_exc()))
+
+
+def parallel_worker_loop(index: int, inbox: multiprocessing.Queue, outbox: multiprocessing.Queue,
+                         steal_flags: Sequence[int]):
+    depth = 0
+    while (message := inbox.get()) is not None:
+        if message[0] == "depth":
+            _, depth, new_best_depths = message
+            for item, item_depth in new_best_depths:
+                best_depths.setdefault(item, item_depth)
+            if goal_bound is not None:
+                goal_bound.start_depth(depth)
+            continue
+
+        _, path, lower, upper = message
+        # Results go back to the main process, which does all the saving
+        output = UnitOutput()
+        unit_output.set(output)
+        if collect_stats:
+            set_search_stats(stats.SearchStats(depth))
+            output.stats = search_stats
+
+        state = GameState(init_state, len(init_state) + depth)
+        remaining_depth = seek_local(state, path, depth)
+        count = dls_local(state, remaining_depth, lower, upper, unit_cursor(path, depth))
+
+        # Answer a steal request that came in too late
+        if steal_flags[index]:
+            steal_flags[index] = 0
+            outbox.put(("split", index, None))
+        outbox.put(("done", index, count, output))
+
+
+async def send_message(writer: asyncio.StreamWriter, message: dict):
+    # Json, prefixed with its length
+    data = json.dumps(message).encode("utf-8")
+    writer.write(len(data).to_bytes(4, "big") + data)
+    await writer.drain()
+
+
+async def receive_message(reader: asyncio.StreamReader) -> Optional[dict]:
+    """
+    :return: The next message, or None if the other side closed the connection
+    """
+    try:
+        header = await reader.readexactly(4)
+    except asyncio.IncompleteReadError:
+        return None
+    return json.loads(await reader.readexactly(int.from_bytes(header, "big")))
+
+
+class DistributedSearch:
+    """
+    Hands out units of work to workers on other machines, which connect over TCP (see distributed_worker).
+    Like ParallelSearch, the tree is split at parallel_prefix_depth and results are merged back in DFS order,
+    but there's no work stealing, so a deeper split balances better.
+    Each worker searches with its own recipe handler, i.e. its own copy of the recipe database.
+    If a worker disconnects, its unit goes back in the queue for another worker.
+    """
+    server: Optional[asyncio.Server]
+    units: asyncio.Queue  # (index, depth, path, cursor), or None to stop a handler
+    results: dict[int, tuple[int, UnitOutput]]
+    results_updated: asyncio.Event
+    writers: set[asyncio.StreamWriter]
+    handlers: set[asyncio.Task]  # serve_worker tasks, one per connected worker
+
+    def __init__(self):
+        self.server = None
+        self.units = asyncio.Queue()
+        self.results = {}
+        self.results_updated = asyncio.Event()
+        self.writers = set()
+        self.handlers = set()
+
+    async def start(self, host: str, port: int):
+        self.server = await asyncio.start_server(self.serve_worker, host, port)
+        print(f"Waiting for workers on {host}:{port}")
+
+    async def serve_worker(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        address = writer.get_extra_info("peername")
+        print(f"Worker connected: {address}")
+        self.writers.add(writer)
+        self.handlers.add(asyncio.current_task())
+        synced_best_depths = 0
+        unit = None
+        try:
+            await send_message(writer, worker_config())
+            while True:
+                unit = await self.units.get()
+                if unit is None:
+                    return
+                index, depth, path, cursor = unit
+                # Send over everything found since this worker's last unit
+                new_best_depths = newest_best_depths(len(best_depths) - synced_best_depths)
+                synced_best_depths = len(best_depths)
+                await send_message(writer, {"depth": depth, "path": path, "cursor": cursor,
+                                            "best_depths": new_best_depths})
+                reply = await receive_message(reader)
+                if reply is None:
+                    raise ConnectionError("Connection closed")
+                self.results[index] = (reply["count"], UnitOutput.from_dict(reply["output"]))
+                unit = None
+                self.results_updated.set()
+        except (OSError, EOFError, ValueError, KeyError) as e:
+            print(f"Lost worker {address}: {e!r}")
+            if unit is not None:
+                self.units.put_nowait(unit)
+        finally:
+            self.writers.discard(writer)
+            self.handlers.discard(asyncio.current_task())
+            writer.close()
+
+    async def run_depth(self, depth: int, prefixes: list[list[int]]) -> int:
+        for index, prefix in enumerate(prefixes):
+            self.units.put_nowait((index, depth, prefix, unit_cursor(prefix, depth)))
+
+        count = 0
+        merged = 0
+        while merged < len(prefixes):
+            await self.results_updated.wait()
+            self.results_updated.clear()
+            # Merge everything that's complete, in order
+            while merged in self.results:
+                unit_count, output = self.results.pop(merged)
+                count += unit_count
+                output.merge()
+                merged += 1
+        return count
+
+    async def close(self):
+        # Stop the handlers, rather than cancelling them, so that they end cleanly
+        while not self.units.empty():
+            self.units.get_nowait()
+        handlers = list(self.handlers)
+        for _ in handlers:
+            self.units.put_nowait(None)
+        # Workers exit once their connection is closed
+        for writer in self.writers:
+            writer.close()
+        await asyncio.gather(*handlers, return_exceptions=True)
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+
+async def distributed_worker(session: aiohttp.ClientSession, host: str, port: int):
+    global best_depths
+
+    # The coordinator saves progress
+    atexit.unregister(save_last_state)
+    reader, writer = await asyncio.open_connection(host, port)
+    print(f"Connected to coordinator at {host}:{port}")
+    apply_worker_config(await receive_message(reader))
+    best_depths = {}
+
+    depth = 0
+    while (message := await receive_message(reader)) is not None:
+        path = message["path"]
+        for item, item_depth in message["best_depths"]:
+            best_depths.setdefault(item, item_depth)
+        if message["depth"] != depth:
+            depth = message["depth"]
+            if goal_bound is not None:
+                goal_bound.start_depth(depth)
+
+        # Results go back to the coordinator, which does all the saving
+        output = UnitOutput()
+        unit_output.set(output)
+        if collect_stats:
+            set_search_stats(stats.SearchStats(depth))
+            output.stats = search_stats
+
+        state = GameState(init_state, len(init_state) + depth)
+        if recipe_handler.local_only:
+            remaining_depth = seek_local(state, path, depth)
+            count = dls_local(state, remaining_depth, cursor=message["cursor"])
+        else:
+            remaining_depth = await seek(session, state, path, depth)
+            count = await dls(session, state, remaining_depth, cursor=message["cursor"])
+        await send_message(writer, {"count": count, "output": output.to_dict()})
+
+    writer.close()
+    print("Coordinator closed the connection")
+
+
+def set_search_stats(new_stats: Optional[stats.SearchStats]):
+    global search_stats
+    search_stats = new_stats
+    recipe_handler.stats = new_stats
+
+
+def resume_cursor(depth: int) -> list[int]:
+    """
+    The path to resume a search of this depth from, or an empty list to search it from the start.
+    """
+    if last_game_state is None or len(last_game_state) - len(init_state) != depth:
+        return []
+    return last_game_state[len(init_state):]
+
+
+def unit_cursor(path: list[int], depth: int) -> list[int]:
+    """
+    The part of the resume cursor below a unit of work, if the cursor goes through it.
+    """
+    cursor = resume_cursor(depth)
+    if cursor[:len(path)] != path:
+        return []
+    return cursor[len(path):]
 
 
 async def iterative_deepening_dfs(session: aiohttp.ClientSession):
@@ -302,31 +1573,247 @@ async def iterative_deepening_dfs(session: aiohttp.ClientSession):
     if last_game_state is not None:
         curDepth = len(last_game_state) - len(init_state)
         print(f"Resuming from depth {curDepth}")
-        print(last_game_state.state)
+        print(last_game_state)
+
+    global prefetcher
+    if prefetch_lookahead > 0 and not recipe_handler.local_only:
+        prefetcher = Prefetcher()
+
+    in_flight = max_in_flight_batches
+    if in_flight is None and "max_in_flight_batches" not in persistent_config:
+        in_flight = concurrent_subtrees + (1 if prefetcher is not None else 0)
+    if in_flight is not None:
+        recipe_handler.set_max_in_flight_batches(in_flight)
+
+    global productive_pairs
+    if productive_index and recipe_handler.local_only:
+        productive_pairs = ProductivePairs(recipe_handler.get_productive_pairs(), init_state)
+    elif productive_index:
+        print("The productive pair index is only available for local-only searches.")
+
+    global goal_bound
+    goal_bound = None
+    if goal_targets and recipe_handler.local_only:
+        goal_bound = GoalBound(recipe_handler.get_local_recipes(), init_state, goal_targets)
+    elif goal_targets:
+        print("Goal-directed search is only available for local-only searches, searching everything.")
+
+    use_parallel = parallel_workers > 0 and recipe_handler.local_only
+    if parallel_workers > 0 and not recipe_handler.local_only:
+        print("Parallel search is only available for local-only searches, searching on a single core.")
+    parallel_search: Optional[ParallelSearch] = None
+    distributed_search: Optional[DistributedSearch] = None
+    if coordinator_address is not None:
+        distributed_search = DistributedSearch()
+        await distributed_search.start(*coordinator_address)
+
+    global search_progress
+    depth_counts = []  # States at each depth fully searched in this run, for estimating the next ones
 
+    try:
+        while True:
+            prev_visited = len(visited)
+            if goal_bound is not None and not goal_bound.start_depth(curDepth):
+                print("Found all targets")
+                break
+            cursor = resume_cursor(curDepth)
+            if collect_stats:
+                set_search_stats(stats.SearchStats(curDepth))
+            if progress_interval > 0:
+                search_progress = progress.SearchProgress(curDepth, len(init_state), progress_interval,
+                                                          depth_counts, last_game_state if cursor else None)
+                if (estimate := search_progress.estimate_total()) is not None:
+                    print(f"Depth {curDepth}: expecting about {estimate} states", flush=True)
+
+            if distributed_search is not None and curDepth > parallel_prefix_depth:
+                count = await distributed_dls(session, distributed_search, curDepth)
+            elif use_parallel and curDepth > parallel_prefix_depth:
+                if parallel_search is None:
+                    parallel_search = ParallelSearch(parallel_workers)
+                count = parallel_dls(parallel_search, curDepth)
+            elif recipe_handler.local_only:
+                count = dls_local(GameState(init_state, len(init_state) + curDepth), curDepth, cursor=cursor)
+            elif concurrent_subtrees > 1 and curDepth > parallel_prefix_depth:
+                count = await concurrent_dls(session, curDepth)
+            else:
+                count = await dls(session, GameState(init_state, len(init_state) + curDepth), curDepth,
+                                  cursor=cursor)
+            print(count)
+            if not cursor:
+                depth_counts.append(count)
+            if prefetcher is not None:
+                await prefetcher.drain()
+            if search_stats is not None:
+                search_stats.dump(stats_file)
+
+            print(f"{curDepth}   {len(visited)}     {time.perf_counter() - start_time:.4f}")
+            if curDepth >= depth_limit > 0:
+                break
+            # Only relevant for local files - if exhausted the outputs, stop
+            # Goal-directed searches only record targets, which can take a few depths to show up
+            if goal_bound is None and len(visited) == prev_visited and \
+                    curDepth > len(last_game_state) - len(init_state):
+                break
+            curDepth += 1
+    finally:
+        search_progress = None
+        set_search_stats(None)
+        if parallel_search is not None:
+            parallel_search.close()
+        if distributed_search is not None:
+            await distributed_search.close()
+
+
+def parallel_dls(parallel_search: ParallelSearch, depth: int) -> int:
+    global prefix_units
+
+    # Walk the top of the tree to collect the work units
+    prefix_units = []
+    dls_local(GameState(init_state, len(init_state) + depth), depth,
+              cursor=resume_cursor(depth)[:parallel_prefix_depth])
+    prefixes = prefix_units
+    prefix_units = None
+
+    return parallel_search.run_depth(depth, prefixes)
+
+
+async def distributed_dls(session: aiohttp.ClientSession, distributed_search: DistributedSearch, depth: int) -> int:
+    global prefix_units
+
+    # Walk the top of the tree to collect the work units
+    prefix_units = []
+    cursor = resume_cursor(depth)[:parallel_prefix_depth]
+    if recipe_handler.local_only:
+        dls_local(GameState(init_state, len(init_state) + depth), depth, cursor=cursor)
+    else:
+        await dls(session, GameState(init_state, len(init_state) + depth), depth, cursor=cursor)
+    prefixes = prefix_units
+    prefix_units = None
+
+    return await distributed_search.run_depth(depth, prefixes)
+
+
+async def concurrent_dls(session: aiohttp.ClientSession, depth: int) -> int:
+    """
+    Searches the subtrees at parallel_prefix_depth concurrently, so that more than one
+    batch request can be in flight. Outputs are merged back in DFS order.
+    """
+    global prefix_units
+
+    # Walk the top of the tree to collect the subtrees
+    prefix_units = []
+    await dls(session, GameState(init_state, len(init_state) + depth), depth,
+              cursor=resume_cursor(depth)[:parallel_prefix_depth])
+    prefixes = prefix_units
+    prefix_units = None
+
+    semaphore = asyncio.Semaphore(concurrent_subtrees)
+
+    async def search_subtree(path: list[int]) -> tuple[int, UnitOutput]:
+        async with semaphore:
+            # Each task has its own context, so this doesn't affect the other subtrees
+            output = UnitOutput()
+            unit_output.set(output)
+            state = GameState(init_state, len(init_state) + depth)
+            remaining_depth = await seek(session, state, path, depth)
+            return await dls(session, state, remaining_depth, cursor=unit_cursor(path, depth)), output
+
+    # Only a few subtrees are started ahead of the oldest unmerged one. Outputs wait in memory until they're
+    # merged, and the checkpoint only moves on when they are, so finished subtrees shouldn't pile up behind a slow one
+    window = 2 * concurrent_subtrees
+    paths = iter(prefixes)
+    tasks = deque()
+    count = 0
+    try:
+        while True:
+            while len(tasks) < window and (path := next(paths, None)) is not None:
+                tasks.append(asyncio.create_task(search_subtree(path)))
+            if not tasks:
+                break
+            subtree_count, output = await tasks.popleft()
+            count += subtree_count
+            output.merge()
+    finally:
+        for task in tasks:
+            task.cancel()
+    return count
+
+
+def breadth_first_search():
+    """
+    Breadth first search over the sets of crafted items, like the old BFS in old/main_1.1.py.
+    States with the same items are the same state no matter what order they were crafted in, so every set is
+    only expanded once, and shallow levels aren't walked again for every depth like in IDDFS.
+    Each level is a file of sorted item ID tuples (see frontier.py), deduplicated with an external merge sort.
+    Only best depths are recorded, since a set doesn't remember how its items were crafted.
+    """
+    init_items = [intern_item(item) for item in init_state]
+    init_set = set(init_items)
+    crafts: dict[tuple[int, int], int] = {}  # Pair of item IDs -> result item ID, -1 for Nothing
+
+    def craft(u: int, v: int) -> int:
+        pair = (u, v) if u <= v else (v, u)
+        try:
+            return crafts[pair]
+        except KeyError:
+            result = recipe_handler.combine_local(item_names[u], item_names[v])
+            crafts[pair] = -1 if result == "Nothing" else intern_item(result)
+            return crafts[pair]
+
+    start_time = time.perf_counter()
+    level: Iterable[tuple[int, ...]] = [()]
+    depth = 1
     while True:
         prev_visited = len(visited)
-        print(await dls(
-            session,
-            GameState(
-                list(init_state),
-                [-1 for _ in range(len(init_state))],
-                set(),
-                [0 for _ in range(len(init_state))]
-            ),
-            curDepth))
-
-        print(f"{curDepth}   {len(visited)}     {time.perf_counter() - start_time:.4f}")
-        if curDepth >= depth_limit > 0:
-            break
-        # Only relevant for local files - if exhausted the outputs, stop
-        if len(visited) == prev_visited and curDepth > len(last_game_state) - len(init_state):
+        writer = frontier.FrontierWriter(bfs_directory, depth, bfs_chunk_size)
+        for crafted in level:
+            # Same as the 30 char limit in dls, nothing is crafted from such items
+            if any(len(item_names[item]) > recipe.WORD_COMBINE_CHAR_LIMIT for item in crafted):
+                continue
+            items = init_items + list(crafted)
+            crafted_set = set(crafted)
+            for j in range(len(items)):
+                for i in range(j + 1):
+                    result = craft(items[i], items[j])
+                    if result < 0 or result in init_set or result in crafted_set:
+                        continue
+                    record_best_depth(item_names[result], depth)
+                    writer.add(tuple(sorted(crafted + (result,))))
+
+        next_level = writer.finish(os.path.join(bfs_directory, f"level_{depth}.bin"))
+        if isinstance(level, frontier.Frontier):
+            level.delete()
+        level = next_level
+        print(len(level))
+        print(f"{depth}   {len(visited)}     {time.perf_counter() - start_time:.4f}")
+
+        if depth >= depth_limit > 0 or len(visited) == prev_visited:
             break
-        curDepth += 1
+        depth += 1
+    level.delete()
 
 
 async def main():
     # tracemalloc.start()
+    if worker_address is not None:
+        # Everything is saved by the coordinator
+        async with aiohttp.ClientSession() as session:
+            await distributed_worker(session, *worker_address)
+        return
+
+    if batch_file is not None:
+        async with aiohttp.ClientSession() as session:
+            await run_batch(session, util.load_json(batch_file))
+        return
+
+    # Before clearing the optimals, since BFS doesn't write any
+    if bfs_engine:
+        if recipe_handler.local_only and not allow_starting_elements:
+            breadth_first_search()
+            return
+        print("The BFS engine is only available for local-only searches without starting element results, "
+              "using IDDFS.")
+
     if resume_last_run:
         load_last_state()
     else:
@@ -337,36 +1824,107 @@ async def main():
         await iterative_deepening_dfs(session)
 
 
+async def run_batch(session: aiohttp.ClientSession, jobs: list[dict]):
+    """
+    Run several searches in one process, one after another. They share the recipe handler and its database
+    connection, so the cache stays warm from one search to the next, and the same session for requests.
+    Each job has a "name", and "preset" (see starting_presets) or "starting_items". Anything else defaults to
+    the current settings: "depth", "extra_depth", "case_sensitive", "allow_starting_elements", "targets", "resume".
+    Recipes go to the job's own table in optimals.db, and progress to its own checkpoint journal.
+    """
+    global init_state, depth_limit, extra_depth, case_sensitive, allow_starting_elements, goal_targets, \
+        visited, best_depths, last_game_state, new_last_game_state, checkpoint_journal, checkpoint_file, \
+        persistent_file, autosave_counter, optimal_handler
+
+    defaults = {
+        "depth": depth_limit,
+        "extra_depth": extra_depth,
+        "case_sensitive": case_sensitive,
+        "allow_starting_elements": allow_starting_elements,
+        "targets": goal_targets,
+        "resume": resume_last_run,
+    }
+    for job in jobs:
+        name = job["name"]
+        settings = defaults | job
+        print(f"Batch job {name}")
+
+        if "preset" in job:
+            init_state = starting_presets[job["preset"]]
+        else:
+            init_state = tuple(job.get("starting_items", DEFAULT_STARTING_ITEMS))
+        for item in init_state:
+            recipe_handler.add_starting_item(item, "", False)
+        depth_limit = settings["depth"]
+        extra_depth = settings["extra_depth"]
+        case_sensitive = settings["case_sensitive"]
+        allow_starting_elements = settings["allow_starting_elements"]
+        goal_targets = settings["targets"]
+
+        # Start from a clean slate, apart from the recipes
+        visited = set()
+        best_depths = {}
+        last_game_state = None
+        new_last_game_state = None
+        autosave_counter = 0
+        checkpoint_journal = None
+        checkpoint_file = f"persistent_{file_sanitize(name)}.journal"
+        persistent_file = f"persistent_{file_sanitize(name)}.json"
+        optimal_handler = optimals.OptimalRecipeWriter(name)
+        if settings["resume"]:
+            load_last_state()
+        else:
+            optimal_handler.clear()
+
+        await iterative_deepening_dfs(session)
+
+        save_last_state()
+        if checkpoint_journal is not None:
+            checkpoint_journal.close()
+        # Saved for good, so that the save at exit doesn't touch this job's journal again
+        checkpoint_journal = None
+        new_last_game_state = None
+        optimal_handler.close()
+
+
 def load_last_state():
-    global new_last_game_state, last_game_state, visited, best_depths
+    global new_last_game_state, last_game_state, visited, best_depths, checkpoint_journal
+    journal = checkpoint.CheckpointJournal(checkpoint_file)
     try:
-        with open(persistent_file, "r", encoding="utf-8") as file:
-            last_state_json = json.load(file)
-        last_game_state = GameState(
-            [],
-            last_state_json["GameState"],
-            set(),
-            []
-        )
-        new_last_game_state = last_game_state
-        visited = set(last_state_json["BestDepths"].keys())
-        best_depths = last_state_json["BestDepths"]
+        last_game_state, best_depths = journal.replay()
+        checkpoint_journal = journal
     except FileNotFoundError:
-        last_game_state = None
+        # Older runs saved everything as json
+        try:
+            with open(persistent_file, "r", encoding="utf-8") as file:
+                last_state_json = json.load(file)
+            last_game_state = last_state_json["GameState"]
+            best_depths = last_state_json["BestDepths"]
+        except FileNotFoundError:
+            last_game_state = None
+    new_last_game_state = last_game_state
+    visited = set(best_depths.keys())
 
 
 @atexit.register
 def save_last_state():
+    global checkpoint_journal
     print("Autosaving progress...")
     if new_last_game_state is None:
         return
-    last_state_json = {
-        "GameState": new_last_game_state.state,
-        "BestDepths": best_depths
-    }
-    with open(persistent_temporary_file, "w", encoding="utf-8") as file:
-        json.dump(last_state_json, file, ensure_ascii=False, indent=4)
-    os.replace(persistent_temporary_file, persistent_file)
+    # Every recipe found before the cursor has to be on disk before the cursor is, or resuming skips them
+    optimal_handler.flush()
+    cursor = list(new_last_game_state)
+    if checkpoint_journal is None:
+        # New search, or one resumed from json. Either way, start a fresh journal with everything so far
+        checkpoint_journal = checkpoint.CheckpointJournal(checkpoint_file)
+        checkpoint_journal.compact(best_depths, cursor)
+        return
+
+    # Only what's new since the last save
+    checkpoint_journal.append(newest_best_depths(len(best_depths) - checkpoint_journal.depth_records), cursor)
+    if checkpoint_journal.stale_records >= checkpoint_compact_interval:
+        checkpoint_journal.compact(best_depths, cursor)
 
 
 def parse_args():
@@ -377,9 +1935,39 @@ def parse_args():
     parser.add_argument("--case-sensitive", action="store_true", help="Case sensitive")
     parser.add_argument("--allow-starting-elements", action="store_true", help="Allow starting elements")
     parser.add_argument("--resume-last-run", action="store_true", help="Resume last run")
+    parser.add_argument("-w", "--workers", type=int, default=0, help="Worker processes for local-only searches")
+    parser.add_argument("-p", "--prefetch", type=int, default=0,
+                        help="Upcoming sibling states to prefetch requests for when using the API")
+    parser.add_argument("-c", "--concurrent-subtrees", type=int, default=1,
+                        help="Subtrees searched at once when using the API. Also allows as many batch requests "
+                             "at once, unless --in-flight is given")
+    parser.add_argument("--in-flight", type=int, default=None,
+                        help="Batch requests waiting on the API at once (default: concurrent subtrees, "
+                             "plus one when prefetching)")
+    parser.add_argument("--progress-interval", type=float, default=60,
+                        help="Seconds between progress reports, 0 to disable")
+    parser.add_argument("--stats", action="store_true", help="Write per-depth search statistics to stats.jsonl")
+    parser.add_argument("--productive-index", action="store_true",
+                        help="Only try pairs known to craft something, "
+                             "for local-only searches with many starting items")
+    parser.add_argument("-t", "--targets", nargs="+", default=None,
+                        help="Only search for these items, and stop once they're all found (local-only)")
+    parser.add_argument("--bfs", action="store_true",
+                        help="Breadth first search over item sets with levels on disk, for local-only searches")
+    parser.add_argument("-b", "--batch", default=None, metavar="FILE",
+                        help="Run the searches listed in this json file one after another, sharing the cache")
+    parser.add_argument("--coordinator", type=parse_address, default=None, metavar="HOST:PORT",
+                        help="Listen for workers on other machines, and split the search between them")
+    parser.add_argument("--worker", type=parse_address, default=None, metavar="HOST:PORT",
+                        help="Search for the coordinator at this address")
     return parser.parse_args()
 
 
+def parse_address(address: str) -> tuple[str, int]:
+    host, _, port = address.rpartition(":")
+    return host, int(port)
+
+
 if __name__ == "__main__":
     # Parse arguments
     # args = parse_args()
@@ -390,6 +1978,18 @@ if __name__ == "__main__":
     # case_sensitive = args.case_sensitive
     # allow_starting_elements = args.allow_starting_elements
     # resume_last_run = args.resume_last_run
+    # parallel_workers = args.workers
+    # concurrent_subtrees = args.concurrent_subtrees
+    # max_in_flight_batches = args.in_flight
+    # prefetch_lookahead = args.prefetch
+    # progress_interval = args.progress_interval
+    # collect_stats = args.stats
+    # productive_index = args.productive_index
+    # goal_targets = args.targets
+    # bfs_engine = args.bfs
+    # batch_file = args.batch
+    # coordinator_address = args.coordinator
+    # worker_address = args.worker
 
     if os.name == 'nt':
         asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
@@ -1,20 +1,33 @@
 # TODO: File for optimal storage
+import atexit
+import queue
+import re
 import sqlite3
+import threading
+import time
+from typing import Optional
 
 
 class OptimalRecipeStorage:
     db: sqlite3.Connection
     db_location: str = "cache/optimals.db"
+    table: str = "optimals"
     closed: bool = False
 
-    def __init__(self):
+    def __init__(self, namespace: str = ""):
+        """
+        :param namespace: If set, recipes are kept in a separate table, for searches with different starting items
+        """
+        if namespace:
+            self.table = "optimals_" + re.sub(r"\W", "_", namespace)
         self.db = sqlite3.connect(self.db_location, isolation_level=None)
         self.db.execute("pragma journal_mode=wal")
-        self.db.execute("CREATE TABLE IF NOT EXISTS optimals (id INTEGER PRIMARY KEY, name TEXT UNIQUE, optimal TEXT)")
+        self.db.execute(f"CREATE TABLE IF NOT EXISTS {self.table} "
+                        f"(id INTEGER PRIMARY KEY, name TEXT UNIQUE, optimal TEXT)")
 
     def get_optimal(self, name: str) -> str:
         cursor = self.db.cursor()
-        cursor.execute("SELECT optimal FROM optimals WHERE name = ?", (name,))
+        cursor.execute(f"SELECT optimal FROM {self.table} WHERE name = ?", (name,))
         result = cursor.fetchone()
         if result is None:
             return ""
@@ -22,15 +35,15 @@ class OptimalRecipeStorage:
 
     def get_all_optimals(self) -> list[tuple[int, str, str]]:
         cursor = self.db.cursor()
-        cursor.execute("SELECT * FROM optimals")
+        cursor.execute(f"SELECT * FROM {self.table}")
         return cursor.fetchall()
 
     def add_optimal(self, name: str, optimal: str):
         cursor = self.db.cursor()
         if self.get_optimal(name) == "":
-            cursor.execute("INSERT INTO optimals (name, optimal) VALUES (?, ?)", (name, optimal))
+            cursor.execute(f"INSERT INTO {self.table} (name, optimal) VALUES (?, ?)", (name, optimal))
         else:
-            cursor.execute("update optimals set optimal = optimal || ? where name = ?", (optimal, name))
+            cursor.execute(f"update {self.table} set optimal = optimal || ? where name = ?", (optimal, name))
 
     # def remove_optimal(self, name: str):
     #     cursor = self.db.cursor()
@@ -38,7 +51,7 @@ class OptimalRecipeStorage:
 
     def clear(self):
         cursor = self.db.cursor()
-        cursor.execute("DELETE FROM optimals")
+        cursor.execute(f"DELETE FROM {self.table}")
 
     def close(self):
         if not self.closed:
@@ -46,6 +59,121 @@ class OptimalRecipeStorage:
             self.closed = True
 
 
+class OptimalRecipeWriter(OptimalRecipeStorage):
+    """
+    Same as OptimalRecipeStorage, but recipes are written by a background thread, so the search never waits on disk.
+    add_optimal only queues the recipe, and the writer groups queued recipes into large transactions.
+    The queue is bounded, so if the disk can't keep up, add_optimal blocks instead of using more and more memory.
+    Reads wait for everything queued before them to be written.
+    The thread is only started once something is queued, so processes that never write don't have one.
+    """
+    queue_size: int = 10000  # Recipes waiting to be written before add_optimal blocks
+    batch_size: int = 1000  # Recipes per transaction, at most
+    commit_interval: float = 1  # Seconds before a partial batch is written anyway
+    tasks: queue.Queue
+    thread: Optional[threading.Thread] = None
+    error: Optional[BaseException] = None
+
+    def __init__(self, namespace: str = ""):
+        super().__init__(namespace)
+        self.tasks = queue.Queue(self.queue_size)
+
+    def put(self, task: Optional[tuple]):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.write_loop, daemon=True)
+            self.thread.start()
+            # Daemon threads are killed at exit, so whatever is queued has to be written before that
+            atexit.register(self.close)
+        self.tasks.put(task)
+
+    def add_optimal(self, name: str, optimal: str):
+        if self.error is not None:
+            raise self.error
+        self.put(("add", name, optimal))
+
+    def get_optimal(self, name: str) -> str:
+        self.flush()
+        return super().get_optimal(name)
+
+    def get_all_optimals(self) -> list[tuple[int, str, str]]:
+        self.flush()
+        return super().get_all_optimals()
+
+    def clear(self):
+        self.put(("clear",))
+        self.flush()
+
+    def flush(self):
+        """
+        Wait until everything queued so far is written.
+        """
+        if self.closed or self.thread is None:
+            return
+        done = threading.Event()
+        self.tasks.put(("flush", done))
+        # Don't wait forever on a writer that died
+        while not done.wait(1):
+            if not self.thread.is_alive():
+                break
+        if self.error is not None:
+            raise self.error
+
+    def close(self):
+        if self.closed:
+            return
+        if self.thread is not None:
+            self.tasks.put(None)
+            self.thread.join()
+        super().close()
+
+    def write_loop(self):
+        db = sqlite3.connect(self.db_location, isolation_level=None)
+        pending: dict[str, str] = {}  # Name -> recipes to append, in the order they were queued
+        pending_count = 0
+        deadline = 0.0
+        try:
+            while True:
+                try:
+                    task = self.tasks.get(timeout=max(0.0, deadline - time.monotonic()) if pending else None)
+                except queue.Empty:
+                    task = ("flush", None)
+
+                if task is None:
+                    break
+                if task[0] == "add":
+                    _, name, optimal = task
+                    if not pending:
+                        deadline = time.monotonic() + self.commit_interval
+                    pending[name] = pending.get(name, "") + optimal
+                    pending_count += 1
+                    if pending_count < self.batch_size:
+                        continue
+                elif task[0] == "clear":
+                    pending.clear()
+                    db.execute(f"DELETE FROM {self.table}")
+
+                self.write(db, pending)
+                pending_count = 0
+                if task[0] == "flush" and task[1] is not None:
+                    task[1].set()
+            self.write(db, pending)
+        except BaseException as e:
+            self.error = e
+            raise
+        finally:
+            db.close()
+
+    def write(self, db: sqlite3.Connection, pending: dict[str, str]):
+        if not pending:
+            return
+        db.execute("BEGIN")
+        # Same as add_optimal, one statement per item
+        db.executemany(f"INSERT INTO {self.table} (name, optimal) VALUES (?, ?) "
+                       f"ON CONFLICT(name) DO UPDATE SET optimal = optimal || excluded.optimal", pending.items())
+        db.execute("COMMIT")
+        pending.clear()
+
+
 def main():
     optimal = OptimalRecipeStorage()
     # optimal.clear()
@@ -23,6 +23,8 @@ from optimizers.optimizer_interface import OptimizerRecipeList, optimizer_recipe
 # The actual algorithms are implemented in the `optimizers/` folder
 # The interface is implemented in `optimizer_interface.py`
 
+local_block_size = 10000  # Pairs per bulk lookup in get_all_local_recipes
+
 
 async def _get_all_recipes(session: aiohttp.ClientSession, rh: recipe.RecipeHandler, current: list[str]):
     total_recipe_count = len(current) * (len(current) + 1) // 2
@@ -44,19 +46,19 @@ async def _get_all_recipes(session: aiohttp.ClientSession, rh: recipe.RecipeHand
     tasks = []
     cur_requests = []
     results = []
-    for i, item1 in enumerate(current):
-        for item2 in current[i:]:
-            local_result = rh.get_local(item1, item2)
-            print(f"Local: {item1} + {item2} = {local_result}")
-            if local_result and local_result != rh.local_nothing_indication and local_result not in current:
-                results.append((item1, item2, local_result))
-                progress_addn()
-                continue
-
-            cur_requests.append((item1, item2))
-            if len(cur_requests) >= 50:
-                tasks.append(batch_combine(session, cur_requests.copy()))
-                cur_requests = []
+    pairs = [(item1, item2) for i, item1 in enumerate(current) for item2 in current[i:]]
+    local_results = rh.get_local_many(pairs)
+    for (item1, item2), local_result in zip(pairs, local_results):
+        print(f"Local: {item1} + {item2} = {local_result}")
+        if local_result and local_result != rh.local_nothing_indication and local_result not in current:
+            results.append((item1, item2, local_result))
+            progress_addn()
+            continue
+
+        cur_requests.append((item1, item2))
+        if len(cur_requests) >= 50:
+            tasks.append(batch_combine(session, cur_requests.copy()))
+            cur_requests = []
 
     if cur_requests:
         tasks.append(batch_combine(session, cur_requests))
@@ -94,11 +96,10 @@ async def request_extra_generation(session: aiohttp.ClientSession, rh: recipe.Re
 
 def get_local_generation(rh: recipe.RecipeHandler, current: list[str]):
     new_items = set()
-    for item1 in current:
-        for item2 in current:
-            new_item = rh.get_local(item1, item2)
-            if new_item and new_item != "Nothing" and new_item not in current:
-                new_items.add(new_item)
+    pairs = [(item1, item2) for i, item1 in enumerate(current) for item2 in current[i:]]
+    for new_item in rh.get_local_many(pairs):
+        if new_item and new_item != "Nothing" and new_item not in current:
+            new_items.add(new_item)
     return new_items
 
 
@@ -108,17 +109,19 @@ def get_all_local_recipes(rh: recipe.RecipeHandler, items: list[str]):
     # Only store valid recipes
     recipes = []
     items_set = set([item.lower() for item in items])
-    for u, item1 in enumerate(items):
-        for item2 in items[u:]:
-            new_item = rh.get_local(item1, item2)
-            if new_item.lower() in items_set:
+    pairs = [(item1, item2) for u, item1 in enumerate(items) for item2 in items[u:]]
+    # Looked up in blocks, to still show progress
+    for start in range(0, len(pairs), local_block_size):
+        block = pairs[start:start + local_block_size]
+        for (item1, item2), new_item in zip(block, rh.get_local_many(block)):
+            if new_item and new_item.lower() in items_set:
                 recipes.append((item1, item2, new_item))
-            current_recipe += 1
+        current_recipe += len(block)
 
-            cur_precentage = int(current_recipe / total_recipe_count * 100)
-            last_precentage = int((current_recipe - 1) / total_recipe_count * 100)
-            if cur_precentage != last_precentage:
-                print(f"Recipe Progress: {cur_precentage}% ({current_recipe}/{total_recipe_count})")
+        cur_precentage = int(current_recipe / total_recipe_count * 100)
+        last_precentage = int((current_recipe - len(block)) / total_recipe_count * 100)
+        if cur_precentage != last_precentage:
+            print(f"Recipe Progress: {cur_precentage}% ({current_recipe}/{total_recipe_count})")
     return recipes
 
 
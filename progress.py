@@ -0,0 +1,117 @@
+import time
+from typing import Optional, Sequence
+
+from util import ordered_total, ordered_total_after
+
+
+def format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    days, seconds = divmod(seconds, 86400)
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    if days:
+        return f"{days}d {hours}h {minutes}m"
+    if hours:
+        return f"{hours}h {minutes}m"
+    return f"{minutes}m {seconds}s"
+
+
+class SearchProgress:
+    """
+    Estimates how far along a depth of the search is, and prints it every `interval` seconds.
+
+    The ordering rules alone bound the number of states (ordered_total), and the resume cursor tells how much of
+    that bound is behind us. Most of the bound gets pruned, so it's scaled by the density of states actually found
+    in the part searched so far. Early on that sample is tiny, so it's blended with a guess from the growth of the
+    previous depths, which fades out as more of the depth is searched.
+    """
+    depth: int
+    interval: float
+    total_bound: Optional[int]   # None if the bound is too expensive to compute
+    start_bound: int             # Bound left when this run of the depth started
+    prior_density: Optional[float]
+    states: int                  # States processed in this run of the depth
+    start_time: float
+    last_report: float
+    next_check: int
+
+    check_every = 4096  # States between looking at the clock
+
+    def __init__(self, depth: int, init_size: int, interval: float,
+                 previous_counts: Sequence[int] = (), cursor: Optional[Sequence[int]] = None):
+        """
+        :param depth: The depth being searched
+        :param init_size: Number of starting items
+        :param interval: Seconds between reports
+        :param previous_counts: States processed at each of the previous depths, if they were searched in this run
+        :param cursor: The resume cursor, if resuming in the middle of this depth
+        """
+        self.depth = depth
+        self.interval = interval
+        try:
+            self.total_bound = ordered_total(0, 0, depth, init_size)
+            self.start_bound = self.total_bound if cursor is None else ordered_total_after(list(cursor))
+        except RecursionError:
+            # Thousands of starting items
+            self.total_bound = None
+            self.start_bound = 0
+
+        self.prior_density = None
+        if self.total_bound and len(previous_counts) >= 2 and previous_counts[-2] > 0:
+            # Assume the number of states grows by the same factor as last depth
+            prior = previous_counts[-1] * previous_counts[-1] / previous_counts[-2]
+            self.prior_density = prior / self.total_bound
+
+        self.states = 0
+        self.start_time = time.perf_counter()
+        self.last_report = self.start_time
+        self.next_check = self.check_every
+
+    def estimate_total(self) -> Optional[int]:
+        """
+        Estimated number of states at this depth, before anything has been searched.
+        """
+        if self.prior_density is None:
+            return None
+        return round(self.prior_density * self.total_bound)
+
+    def advance(self, states: int, cursor: Optional[Sequence[int]]):
+        """
+        Count processed states, and report if it's time to.
+        :param states: Newly processed states
+        :param cursor: The resume cursor, i.e. the last state processed
+        """
+        self.states += states
+        if self.states < self.next_check:
+            return
+        self.next_check = self.states + self.check_every
+        now = time.perf_counter()
+        if now - self.last_report < self.interval:
+            return
+        self.last_report = now
+        print(self.report(now, cursor), flush=True)
+
+    def report(self, now: float, cursor: Optional[Sequence[int]]) -> str:
+        elapsed = now - self.start_time
+        rate = self.states / elapsed if elapsed > 0 else 0
+        message = f"Depth {self.depth}: {self.states} states in {format_duration(elapsed)}, {rate:.0f} states/s"
+        if self.total_bound is None or cursor is None:
+            return message
+
+        remaining_bound = ordered_total_after(list(cursor))
+        searched_bound = self.start_bound - remaining_bound
+        if searched_bound <= 0:
+            return message
+
+        # States per unit of the ordering bound
+        density = self.states / searched_bound
+        if self.prior_density is not None:
+            weight = searched_bound / self.start_bound
+            density = weight * density + (1 - weight) * self.prior_density
+
+        remaining = remaining_bound * density
+        total = self.states + (self.total_bound - searched_bound) * density
+        message += f", {1 - remaining / total:.2%} done of ~{total:.0f}"
+        if rate > 0:
+            message += f", ETA {format_duration(remaining / rate)}"
+        return message
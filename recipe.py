@@ -4,6 +4,8 @@ import random
 import sys
 import time
 import traceback
+from collections import OrderedDict
+from functools import lru_cache
 from typing import Optional
 from urllib.parse import quote_plus
 
@@ -12,30 +14,72 @@ import asyncio
 import sqlite3
 
 import util
+from stats import SearchStats
 from util import WORD_COMBINE_CHAR_LIMIT, load_json
 
-# Insert a recipe into the database
+# Insert or update an item. First discoveries stay first discoveries
+upsert_item = ("""
+    INSERT INTO items (emoji, name, first_discovery) VALUES (?, ?, ?)
+    ON CONFLICT (name) DO UPDATE SET
+    emoji = EXCLUDED.emoji,
+    first_discovery = items.first_discovery OR EXCLUDED.first_discovery
+    """)
+
+# Insert an item if it doesn't exist yet
+insert_starting_item = ("""
+    INSERT INTO items (emoji, name, first_discovery) VALUES (?, ?, ?)
+    ON CONFLICT (name) DO NOTHING
+    """)
+
+# Insert a recipe into the database, by item IDs
 insert_recipe = ("""
     INSERT INTO recipes (ingredient1_id, ingredient2_id, result_id)
-    SELECT ing1.id, ing2.id, result.id
-    FROM items   AS result
-    JOIN items   AS ing1   ON ing1.name = ?
-    JOIN items   AS ing2   ON ing2.name = ?
-    WHERE result.name = ?
+    VALUES (?, ?, ?)
     ON CONFLICT (ingredient1_id, ingredient2_id) DO UPDATE SET
     result_id = EXCLUDED.result_id
     """)
 
-# Query for a recipe
+
+@lru_cache(maxsize=1 << 16)
+def start_case(name: str) -> str:
+    # Same as util.to_start_case, which is slow enough to matter for every lookup
+    return util.to_start_case(name)
+
+
+# Query for a recipe, by item IDs. Just a primary key lookup
 query_recipe = ("""
-    SELECT result.name, result.emoji
+    SELECT result_id
     FROM recipes
-    JOIN items   AS ing1   ON ing1.id = recipes.ingredient1_id
-    JOIN items   AS ing2   ON ing2.id = recipes.ingredient2_id
-    JOIN items   AS result ON result.id = recipes.result_id
-    WHERE ing1.name = ? AND ing2.name = ?
+    WHERE ingredient1_id = ? AND ingredient2_id = ?
     """)
 
+# Bulk lookups use chunks of this many pairs (3 parameters each), under SQLite's parameter limit
+query_chunk_size = 300
+
+
+class TokenBucket:
+    """
+    Rate limiter for coroutines: a token every `interval` seconds, and up to `burst` of them saved up while idle.
+    Waiting is done with asyncio.sleep, so the rest of the event loop keeps running in the meantime.
+    """
+    interval: float
+    burst: int
+    next_free: float = 0  # When the next token is available, if none are saved up
+
+    def __init__(self, interval: float, burst: int = 1):
+        self.interval = interval
+        self.burst = burst
+
+    async def acquire(self):
+        now = time.perf_counter()
+        # Tokens saved up while idle, at most burst
+        self.next_free = max(self.next_free, now - (self.burst - 1) * self.interval)
+        # Reserve the slot before waiting, so that waiting coroutines queue up one interval apart
+        wait = self.next_free - now
+        self.next_free += self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
 
 class RecipeHandler:
     db: sqlite3.Connection
@@ -43,12 +87,17 @@ class RecipeHandler:
     closed: bool = False
 
     request_addr: str = "https://neal.fun/api/infinite-craft/pair"
-    last_request: float = 0
-    request_cooldown: float = 0.5  # 0.5s is safe for this API
+    request_cooldown: float = 0.5  # 0.5s is safe for this API. Applies to pair and batch requests alike
+    request_burst: int = 1  # Requests that can go out at once after being idle
+    request_limiter: TokenBucket
     request_lock: asyncio.Lock = asyncio.Lock()
+    max_in_flight_batches: int = 1  # Batch requests that can wait on the API at once
+    batch_semaphore: asyncio.Semaphore
     sleep_time: float = 1.0
     sleep_default: float = 1.0
+    sleep_max: float = 300.0
     retry_exponent: float = 2.0
+    retry_jitter: float = 0.5  # Backoff is randomly up to 50% shorter or longer, so retries don't line up
     local_only: bool = False
     trust_cache_nothing: bool = False  # Trust the local cache for "Nothing" results
     trust_first_run_nothing: bool = False  # Save as "Nothing" in the first run
@@ -62,9 +111,32 @@ class RecipeHandler:
     # Auto-commit settings
     auto_commit: bool = True
     auto_commit_interval: int = 1000  # Commit every 1000 requests
+    auto_commit_time: float = 30.0  # or every 30 seconds, whichever comes first
     current_response_count: int = 0
+    last_commit: float = 0
+
+    # Write-behind buffer for API responses. save_response only records the response here, lookups read it
+    # before the database, and flush() writes everything in one transaction when an auto-commit limit is reached
+    # (whether or not auto_commit is on), and on close. A flush is all or nothing, so the database is never
+    # left with half a response. If the process is killed, unflushed responses are lost, at most the auto-commit
+    # limits' worth, and are requested again when they come up.
+    # First discoveries are written right away, since the API won't say they're new a second time.
+    write_behind: bool = True  # False to write every response right away
+    pending_items: dict[str, tuple[str, bool]]  # Name -> emoji, first discovery
+    pending_recipes: dict[tuple[str, str], str]  # Normalized pair -> result
 
     print_new_recipes: bool = True
+    stats: Optional[SearchStats] = None  # Counts lookups and requests if set
+
+    # In-memory cache of local lookups, by normalized pair. The least recently used pairs are dropped first
+    l1_cache_size: int = 100000  # 0 to disable
+    l1_cache: OrderedDict[tuple[str, str], Optional[str]]
+    l1_hits: int = 0
+    l1_misses: int = 0
+
+    # Item IDs in the database, filled in as items are looked up. IDs never change once an item exists
+    item_ids: dict[str, int]
+    item_names: dict[int, str]
 
     headers: dict[str, str] = {}
 
@@ -76,6 +148,16 @@ class RecipeHandler:
         # Load headers
         self.headers = load_json("headers.json")["api"]
 
+        self.batch_semaphore = asyncio.Semaphore(self.max_in_flight_batches)
+        self.request_limiter = TokenBucket(self.request_cooldown, self.request_burst)
+        self.sleep_time = self.sleep_default
+        self.l1_cache = OrderedDict()
+        self.item_ids = {}
+        self.item_names = {}
+        self.pending_items = {}
+        self.pending_recipes = {}
+        self.last_commit = time.perf_counter()
+
         self.db = sqlite3.connect(self.db_location, isolation_level=None)
         self.db.execute('pragma journal_mode=wal')
         atexit.register(lambda: (self.close()))
@@ -121,6 +203,7 @@ class RecipeHandler:
     def close(self):
         if self.closed:
             return
+        self.flush()
         self.db.commit()
         self.db.close()
         self.closed = True
@@ -137,18 +220,12 @@ class RecipeHandler:
     def add_item(self, item: str, emoji: str, first_discovery: bool = False):
         # print(f"Adding: {item} ({emoji})")
         cur = self.db.cursor()
-        cur.execute("INSERT INTO items (emoji, name, first_discovery) VALUES (?, ?, ?) "
-                    "ON CONFLICT (name) DO UPDATE SET "
-                    "emoji = EXCLUDED.emoji, "
-                    "first_discovery = items.first_discovery OR EXCLUDED.first_discovery",
-                    (emoji, item, first_discovery))
+        cur.execute(upsert_item, (emoji, item, first_discovery))
 
     def add_starting_item(self, item: str, emoji: str, first_discovery: bool = False):
         # print(f"Adding: {item} ({emoji})")
         cur = self.db.cursor()
-        cur.execute("INSERT INTO items (emoji, name, first_discovery) VALUES (?, ?, ?) "
-                    "ON CONFLICT (name) DO NOTHING",
-                    (emoji, item, first_discovery))
+        cur.execute(insert_starting_item, (emoji, item, first_discovery))
 
     def add_item_force_id(self, item: str, emoji: str, first_discovery: bool = False, overwrite_id: int = None):
         cur = self.db.cursor()
@@ -161,15 +238,14 @@ class RecipeHandler:
             print(e)
 
     def get_item(self, item: str) -> Optional[tuple[str, str]]:
+        if item in self.pending_items:
+            self.flush()
         cur = self.db.cursor()
         cur.execute("SELECT emoji, first_discovery FROM items WHERE name = ?", (item,))
         return cur.fetchone()
 
     def add_recipe(self, a: str, b: str, result: str):
-        a = util.to_start_case(a)
-        b = util.to_start_case(b)
-        if a > b:
-            a, b = b, a
+        a, b = self.pair_key(a, b)
 
         # Note that only the *INGREDIENT* will be converted to start case element.
         # because ingredient case does not matter.
@@ -178,17 +254,21 @@ class RecipeHandler:
         self.add_starting_item(b, "", False)
 
         # print(f"Adding: {a} + {b} -> {result}")
+        result_id = self.get_item_id(result)
+        if result_id is None:
+            return  # Results are added by save_response first
         cur = self.db.cursor()
-        cur.execute(insert_recipe, (a, b, result))
+        cur.execute(insert_recipe, (self.get_item_id(a), self.get_item_id(b), result_id))
+        self.l1_cache.pop((a, b), None)
+        self.pending_recipes.pop((a, b), None)
 
     def delete_recipe(self, a: str, b: str):
-        if a > b:
-            a, b = b, a
+        a, b = self.pair_key(a, b)
+        self.l1_cache.pop((a, b), None)
+        self.pending_recipes.pop((a, b), None)
         cur = self.db.cursor()
-        cur.execute("DELETE FROM recipes"
-                    "JOIN items   AS ing1   ON ing1.id = recipes.ingredient1_id"
-                    "JOIN items   AS ing2   ON ing2.id = recipes.ingredient2_id"
-                    "WHERE ing1.name = ? AND ing2.name = ?", (a, b))
+        cur.execute("DELETE FROM recipes WHERE ingredient1_id = ? AND ingredient2_id = ?",
+                    (self.get_item_id(a), self.get_item_id(b)))
 
     def save_response(self, a: str, b: str, response: dict):
         self.current_response_count += 1
@@ -209,36 +289,243 @@ class RecipeHandler:
             print(f"FIRST DISCOVERY: {a} + {b} -> {result}")
 
         # Items - emoji, new discovery
-        self.add_item(result, emoji, new)
+        if self.write_behind:
+            if result in self.pending_items:
+                new = new or self.pending_items[result][1]
+            self.pending_items[result] = (emoji, new)
+        else:
+            self.add_item(result, emoji, new)
 
         # Save as the fake nothing if it's the first run
         if result == "Nothing" and self.get_local(a, b) and not self.trust_first_run_nothing:
             result = self.local_nothing_indication
 
         # Recipe: A + B --> C
-        self.add_recipe(a, b, result)
-
-        # Autosave check
-        if self.auto_commit and self.current_response_count >= self.auto_commit_interval:
+        if self.write_behind:
+            key = self.pair_key(a, b)
+            self.pending_recipes[key] = result
+            self.l1_cache.pop(key, None)
+        else:
+            self.add_recipe(a, b, result)
+        if self.write_behind and new:
+            self.flush()
+
+        # Autosave check. The write-behind buffer is always written out, even without auto-commit
+        if (self.auto_commit or self.write_behind) and \
+                (self.current_response_count >= self.auto_commit_interval or
+                 time.perf_counter() - self.last_commit >= self.auto_commit_time):
             print("Auto committing recipes...", flush=True)
+            self.flush()
             self.db.commit()
             self.current_response_count = 0
+            self.last_commit = time.perf_counter()
+
+    def flush(self):
+        """
+        Write the buffered responses to the database, in one transaction.
+        """
+        if not self.pending_items and not self.pending_recipes:
+            return
+        items, recipes = self.pending_items, self.pending_recipes
+        ingredients = {name for pair in recipes for name in pair}
+        cur = self.db.cursor()
+        cur.execute("BEGIN")
+        try:
+            cur.executemany(upsert_item, [(emoji, name, new) for name, (emoji, new) in items.items()])
+            cur.executemany(insert_starting_item, [("", name, False) for name in ingredients - items.keys()])
+            self.load_item_ids(ingredients | set(recipes.values()))
+            cur.executemany(insert_recipe, [(self.item_ids[a], self.item_ids[b], self.item_ids[result])
+                                            for (a, b), result in recipes.items() if result in self.item_ids])
+            cur.execute("COMMIT")
+        except BaseException:
+            cur.execute("ROLLBACK")
+            # IDs of items inserted in this transaction are gone again
+            self.item_ids = {}
+            self.item_names = {}
+            raise
+        self.pending_items = {}
+        self.pending_recipes = {}
 
     def get_local(self, a: str, b: str) -> Optional[str]:
-        a = util.to_start_case(a)
-        b = util.to_start_case(b)
+        if self.stats is None:
+            return self._get_local(a, b)
+
+        t = time.perf_counter()
+        result = self._get_local(a, b)
+        self.stats.db_time += time.perf_counter() - t
+        if result is None:
+            self.stats.cache_misses += 1
+        else:
+            self.stats.cache_hits += 1
+        return result
+
+    @staticmethod
+    def pair_key(a: str, b: str) -> tuple[str, str]:
+        a = start_case(a)
+        b = start_case(b)
         if a > b:
             a, b = b, a
+        return a, b
 
+    def _get_local(self, a: str, b: str) -> Optional[str]:
+        key = self.pair_key(a, b)
+        if key in self.pending_recipes:
+            return self.pending_recipes[key]
+        if self.l1_cache_size:
+            try:
+                result = self.l1_cache[key]
+                self.l1_cache.move_to_end(key)
+                self.l1_hits += 1
+                return result
+            except KeyError:
+                self.l1_misses += 1
+
+        result = None
+        a_id = self.get_item_id(key[0])
+        b_id = self.get_item_id(key[1])
+        if a_id is not None and b_id is not None:
+            result_id = self.get_local_by_id(a_id, b_id)
+            if result_id is not None:
+                result = self.get_item_name(result_id)
+
+        if self.l1_cache_size:
+            self.l1_cache[key] = result
+            if len(self.l1_cache) > self.l1_cache_size:
+                self.l1_cache.popitem(last=False)
+        return result
+
+    def get_local_many(self, pairs: list[tuple[str, str]]) -> list[Optional[str]]:
+        """
+        Same as get_local, for many pairs at once. Pairs that aren't in the in-memory cache are
+        looked up in chunks of query_chunk_size, so thousands of pairs take a handful of queries.
+        :return: The results, in the same order as the pairs
+        """
+        if self.stats is None:
+            return self._get_local_many(pairs)
+
+        t = time.perf_counter()
+        results = self._get_local_many(pairs)
+        self.stats.db_time += time.perf_counter() - t
+        misses = results.count(None)
+        self.stats.cache_misses += misses
+        self.stats.cache_hits += len(results) - misses
+        return results
+
+    def _get_local_many(self, pairs: list[tuple[str, str]]) -> list[Optional[str]]:
+        keys = [self.pair_key(a, b) for a, b in pairs]
+        results: list[Optional[str]] = [None] * len(keys)
+        missing: dict[tuple[str, str], list[int]] = {}  # Pair -> positions in the input
+        for i, key in enumerate(keys):
+            if key in self.pending_recipes:
+                results[i] = self.pending_recipes[key]
+            elif self.l1_cache_size and key in self.l1_cache:
+                results[i] = self.l1_cache[key]
+                self.l1_cache.move_to_end(key)
+                self.l1_hits += 1
+            else:
+                missing.setdefault(key, []).append(i)
+        if not missing:
+            return results
+        if self.l1_cache_size:
+            self.l1_misses += len(missing)
+
+        self.load_item_ids({name for key in missing for name in key})
+        found: dict[tuple[str, str], int] = {}  # Pair -> result ID
+        known = [key for key in missing if key[0] in self.item_ids and key[1] in self.item_ids]
         cur = self.db.cursor()
-        cur.execute(query_recipe, (a, b))
-        result = cur.fetchone()
-        if result:
-            return result[0]
-        else:
+        for start in range(0, len(known), query_chunk_size):
+            chunk = known[start:start + query_chunk_size]
+            cur.execute(f"""
+                WITH pairs (i, a, b) AS (VALUES {", ".join(["(?, ?, ?)"] * len(chunk))})
+                SELECT pairs.i, recipes.result_id
+                FROM pairs
+                JOIN recipes ON recipes.ingredient1_id = pairs.a AND recipes.ingredient2_id = pairs.b
+                """, [x for j, (a, b) in enumerate(chunk) for x in (j, self.item_ids[a], self.item_ids[b])])
+            for j, result_id in cur:
+                found[chunk[j]] = result_id
+
+        self.load_item_names(set(found.values()))
+        for key, positions in missing.items():
+            result = self.item_names.get(found[key]) if key in found else None
+            for i in positions:
+                results[i] = result
+            if self.l1_cache_size:
+                self.l1_cache[key] = result
+        if self.l1_cache_size:
+            while len(self.l1_cache) > self.l1_cache_size:
+                self.l1_cache.popitem(last=False)
+        return results
+
+    def load_item_ids(self, names: set[str]):
+        """
+        Fill in item_ids for many names at once. Names that aren't in the database are left out.
+        """
+        names = [name for name in names if name not in self.item_ids]
+        cur = self.db.cursor()
+        for start in range(0, len(names), 3 * query_chunk_size):
+            chunk = names[start:start + 3 * query_chunk_size]
+            cur.execute(f"SELECT id, name FROM items WHERE name IN ({', '.join('?' * len(chunk))})", chunk)
+            for item_id, name in cur:
+                self.item_ids[name] = item_id
+                self.item_names[item_id] = name
+
+    def load_item_names(self, item_ids: set[int]):
+        """
+        Same as load_item_ids, for item_names.
+        """
+        item_ids = [item_id for item_id in item_ids if item_id not in self.item_names]
+        cur = self.db.cursor()
+        for start in range(0, len(item_ids), 3 * query_chunk_size):
+            chunk = item_ids[start:start + 3 * query_chunk_size]
+            cur.execute(f"SELECT id, name FROM items WHERE id IN ({', '.join('?' * len(chunk))})", chunk)
+            for item_id, name in cur:
+                self.item_ids[name] = item_id
+                self.item_names[item_id] = name
+
+    def get_item_id(self, name: str) -> Optional[int]:
+        """
+        The database ID of an item, by its exact name. Ingredients are stored in start case, see pair_key.
+        """
+        try:
+            return self.item_ids[name]
+        except KeyError:
+            pass
+        cur = self.db.cursor()
+        cur.execute("SELECT id FROM items WHERE name = ?", (name,))
+        row = cur.fetchone()
+        if row is None:
+            return None  # Not cached, since it can be added later
+        self.item_ids[name] = row[0]
+        self.item_names[row[0]] = name
+        return row[0]
+
+    def get_item_name(self, item_id: int) -> Optional[str]:
+        try:
+            return self.item_names[item_id]
+        except KeyError:
+            pass
+        cur = self.db.cursor()
+        cur.execute("SELECT name FROM items WHERE id = ?", (item_id,))
+        row = cur.fetchone()
+        if row is None:
             return None
+        self.item_names[item_id] = row[0]
+        self.item_ids[row[0]] = item_id
+        return row[0]
+
+    def get_local_by_id(self, a_id: int, b_id: int) -> Optional[int]:
+        """
+        Same as get_local, by item IDs. Ingredients are ordered by name in the database,
+        so the IDs have to be of a pair as ordered by pair_key.
+        :return: The ID of the result, if the pair is in the database
+        """
+        cur = self.db.cursor()
+        cur.execute(query_recipe, (a_id, b_id))
+        row = cur.fetchone()
+        return row[0] if row else None
 
     def get_uses(self, a: str) -> list[tuple[str, str]]:
+        self.flush()
         cur = self.db.cursor()
         cur.execute("""
             SELECT ing2.name, result.name
@@ -260,7 +547,45 @@ class RecipeHandler:
         part2 = cur.fetchall()
         return part1 + part2
 
+    def get_productive_pairs(self) -> dict[str, set[str]]:
+        """
+        For every item in the local cache, the items it crafts something other than Nothing with.
+        Names are as stored in the database, see util.to_start_case.
+        """
+        self.flush()
+        cur = self.db.cursor()
+        cur.execute("""
+            SELECT ing1.name, ing2.name
+            FROM recipes
+            JOIN items   AS ing1   ON ing1.id = recipes.ingredient1_id
+            JOIN items   AS ing2   ON ing2.id = recipes.ingredient2_id
+            JOIN items   AS result ON result.id = recipes.result_id
+            WHERE result.name NOT IN ('', 'Nothing', ?)
+            """, (self.local_nothing_indication,))
+        partners: dict[str, set[str]] = {}
+        for a, b in cur:
+            partners.setdefault(a, set()).add(b)
+            partners.setdefault(b, set()).add(a)
+        return partners
+
+    def get_local_recipes(self) -> list[tuple[str, str, str]]:
+        """
+        Every recipe in the local cache with a result other than Nothing, as (ingredient1, ingredient2, result).
+        """
+        self.flush()
+        cur = self.db.cursor()
+        cur.execute("""
+            SELECT ing1.name, ing2.name, result.name
+            FROM recipes
+            JOIN items   AS ing1   ON ing1.id = recipes.ingredient1_id
+            JOIN items   AS ing2   ON ing2.id = recipes.ingredient2_id
+            JOIN items   AS result ON result.id = recipes.result_id
+            WHERE result.name NOT IN ('', 'Nothing', ?)
+            """, (self.local_nothing_indication,))
+        return cur.fetchall()
+
     def get_crafts(self, result: str) -> list[tuple[str, str]]:
+        self.flush()
         cur = self.db.cursor()
         cur.execute("""
             SELECT ing1.name, ing2.name
@@ -338,6 +663,30 @@ class RecipeHandler:
         self.save_response(a, b, r)
         return r['result']
 
+    def needs_request(self, local_result: Optional[str]) -> bool:
+        """
+        Whether combine_batch would request a pair again, given its local result.
+        """
+        if local_result is None or local_result == self.local_nothing_indication:
+            return True
+        return not self.trust_cache_nothing and local_result == "Nothing"
+
+    def combine_local(self, a: str, b: str) -> str:
+        """
+        Same as combine for a local-only handler, without going through asyncio.
+        """
+        local_result = self.get_local(a, b)
+        if local_result and local_result != self.local_nothing_indication:
+            return local_result
+        return "Nothing"
+
+    def combine_local_batch(self, batch: list[tuple[str, str]]) -> list[str]:
+        """
+        Same as combine_local, for many pairs at once.
+        """
+        results = self.get_local_many(batch)
+        return [r if r and r != self.local_nothing_indication else "Nothing" for r in results]
+
     async def combine_batch(self, session: aiohttp.ClientSession, batch: list[tuple[str, str]], *,
                             check_local: bool = True) -> \
             list[tuple[str, str, Optional[str]]]:
@@ -350,7 +699,7 @@ class RecipeHandler:
 
         # Query local cache
         if check_local:
-            local_results = [self.get_local(a, b) for a, b in batch]
+            local_results = self.get_local_many(batch)
 
             if self.local_only:
                 final_results = [(a, b, "Nothing") for a, b in batch]
@@ -361,9 +710,7 @@ class RecipeHandler:
                 return final_results
 
             for i, (a, b) in enumerate(batch):
-                if local_results[i] is None or local_results[i] == self.local_nothing_indication:
-                    need_request.append((a, b))
-                elif not self.trust_cache_nothing and local_results[i] == "Nothing":
+                if self.needs_request(local_results[i]):
                     need_request.append((a, b))
                 else:
                     final_results[i] = (a, b, local_results[i])
@@ -402,9 +749,23 @@ class RecipeHandler:
 
         return final_results
 
+    def set_max_in_flight_batches(self, n: int):
+        """
+        Change max_in_flight_batches. Only while no batch requests are waiting.
+        """
+        self.max_in_flight_batches = n
+        self.batch_semaphore = asyncio.Semaphore(n)
+
     async def request_batch(self, session: aiohttp.ClientSession, batch: list[tuple[str, str]]) -> list[dict]:
-        async with self.request_lock:
-            return await self._request_batch(session, batch)
+        async with self.batch_semaphore:
+            if self.stats is None:
+                return await self._request_batch(session, batch)
+            # Concurrent requests all count their own time
+            t = time.perf_counter()
+            result = await self._request_batch(session, batch)
+            self.stats.network_time += time.perf_counter() - t
+            self.stats.api_pairs += len(batch)
+            return result
 
     async def request_pair(self, session: aiohttp.ClientSession, a: str, b: str) -> dict:
         if len(a) > WORD_COMBINE_CHAR_LIMIT or len(b) > WORD_COMBINE_CHAR_LIMIT:
@@ -413,21 +774,31 @@ class RecipeHandler:
         # a_req = quote_plus(a)
         # b_req = quote_plus(b)
 
-        # Don't request too quickly. Have been 429'd way too many times
+        # One at a time, and spaced out by request_limiter. Have been 429'd way too many times
         async with self.request_lock:
-            return await self._request_pair(session, a, b)
+            if self.stats is None:
+                return await self._request_pair(session, a, b)
+            t = time.perf_counter()
+            result = await self._request_pair(session, a, b)
+            self.stats.network_time += time.perf_counter() - t
+            self.stats.api_pairs += 1
+            return result
+
+    async def backoff(self):
+        """
+        Wait after a failed request. Failures in a row wait exponentially longer, until a request succeeds.
+        """
+        delay = min(self.sleep_time, self.sleep_max) * random.uniform(1 - self.retry_jitter, 1 + self.retry_jitter)
+        self.sleep_time = min(self.sleep_time * self.retry_exponent, self.sleep_max)
+        await asyncio.sleep(delay)
 
     async def _request_pair(self, session: aiohttp.ClientSession, a: str, b: str) -> dict:
-        t = time.perf_counter()
-        if (t - self.last_request) < self.request_cooldown:
-            time.sleep(self.request_cooldown - (t - self.last_request))
-        self.last_request = time.perf_counter()
-
         data = f'[["{a}", "{b}"]]'
         url = self.request_addr
         # print(url, data)
 
         while True:
+            await self.request_limiter.acquire()
             try:
                 async with session.post(url, data=data) as resp:
                     # print(resp.status)
@@ -436,15 +807,13 @@ class RecipeHandler:
                         # Single request, so take 1st element of the batch
                         return (await resp.json(content_type=None))[0]
                     else:
-                        time.sleep(self.sleep_time)
-                        self.sleep_time *= self.retry_exponent
+                        await self.backoff()
                         print("Retrying...", flush=True)
             except Exception as e:
                 # Handling more than just that one error
                 print("Unrecognized Error: ", e, file=sys.stderr)
                 traceback.print_exc()
-                time.sleep(self.sleep_time)
-                self.sleep_time *= self.retry_exponent
+                await self.backoff()
                 print("Retrying...", flush=True)
 
     async def _request_batch(self, session, batch):
@@ -455,6 +824,7 @@ class RecipeHandler:
 
         # print(url, batch_data)
         while True:
+            await self.request_limiter.acquire()
             try:
                 async with session.post(url, data=batch_data) as resp:
                     # print(resp.status)
@@ -464,15 +834,13 @@ class RecipeHandler:
                     else:
                         print(f"Request failed with status {resp.status}", file=sys.stderr)
 
-                        time.sleep(self.sleep_time)
-                        self.sleep_time *= self.retry_exponent
+                        await self.backoff()
                         print("Retrying...", flush=True)
             except Exception as e:
                 # Handling more than just that one error
                 print("Unrecognized Error: ", e, file=sys.stderr)
                 traceback.print_exc()
-                time.sleep(self.sleep_time)
-                self.sleep_time *= self.retry_exponent
+                await self.backoff()
                 print("Retrying...", flush=True)
 
 
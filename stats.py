@@ -0,0 +1,47 @@
+import json
+import time
+
+
+class SearchStats:
+    """
+    Counters for one depth of the search, to see which pruning rule or I/O path the time goes to.
+    Everything is a plain attribute so that counting is cheap. Only collected if enabled, see main.collect_stats.
+    """
+    depth: int
+    nodes_expanded: int = 0      # Nodes whose children were looked at
+    leaves: int = 0              # States processed
+    # Children rejected, by rule
+    rejected_nothing: int = 0    # No result
+    rejected_in_items: int = 0   # Result already in the state (or a loop through a starting item)
+    rejected_children: int = 0   # Result already crafted earlier at this level
+    rejected_unused: int = 0     # Crafts skipped because unused items must be used first
+    rejected_char_limit: int = 0  # Nodes over the 30 character limit
+    rejected_goal: int = 0       # Nodes too far from every target, in goal-directed searches
+    # Recipe lookups
+    cache_hits: int = 0
+    cache_misses: int = 0
+    api_pairs: int = 0
+    db_time: float = 0
+    network_time: float = 0
+    start_time: float
+
+    def __init__(self, depth: int = 0):
+        self.depth = depth
+        self.start_time = time.perf_counter()
+
+    def merge(self, other: 'SearchStats'):
+        for key, value in vars(other).items():
+            if key not in ("depth", "start_time"):
+                setattr(self, key, getattr(self, key) + value)
+
+    def to_dict(self) -> dict:
+        total_time = time.perf_counter() - self.start_time
+        d = {key: getattr(self, key) for key in SearchStats.__annotations__ if key != "start_time"}
+        d["total_time"] = total_time
+        # With parallel workers, DB time is summed over all processes, so this can be negative
+        d["search_time"] = total_time - self.db_time - self.network_time
+        return d
+
+    def dump(self, file: str):
+        with open(file, "a", encoding="utf-8") as f:
+            f.write(json.dumps(self.to_dict()) + "\n")
@@ -1,5 +1,6 @@
 import json
 import math
+from functools import cache
 
 # import llama_cpp
 # from huggingface_hub import hf_hub_download
@@ -25,6 +26,44 @@ def int_to_pair(n: int) -> tuple[int, int]:
     return i, j
 
 
+@cache
+def limit(n: int) -> int:
+    return n * (n + 1) // 2
+
+
+@cache
+def ordered_total(cur_limit, cur_step, max_steps, init_list_size=4):
+    """
+    Number of GameStates that follow the ordering rules, without looking at any recipes.
+    :param cur_limit: The smallest pair index allowed for the current step
+    :param cur_step: The current step
+    :param max_steps: The depth of the GameStates
+    :param init_list_size: Number of starting items
+    """
+    if cur_step == max_steps:
+        return 1
+    if cur_limit >= limit(cur_step + init_list_size):
+        return 0
+
+    return \
+            ordered_total(cur_limit + 1, cur_step + 1, max_steps, init_list_size) + \
+            ordered_total(cur_limit + 1, cur_step, max_steps, init_list_size)
+
+
+def ordered_total_after(current_state: list[int]) -> int:
+    """
+    Number of GameStates of the same depth that come after current_state in DFS order, same as ordered_total.
+    """
+    init_list_size = 0
+    count = 0
+    for i, val in enumerate(current_state):
+        if val == -1:
+            init_list_size = i + 1
+            continue
+        count += ordered_total(val + 1, i - init_list_size, len(current_state) - init_list_size, init_list_size)
+    return count
+
+
 def file_sanitize(s: str) -> str:
     s = s.replace("%", "%%")
     s = s.replace("\\", "%b")  # Backslash